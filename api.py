@@ -1,25 +1,56 @@
-from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional, Union
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from bson import ObjectId
-import pytz
-from fastapi.responses import JSONResponse
-from mongo_utils import MongoDBHandler
+import orjson
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from logging_utils import setup_logging
+from mongo_utils import AsyncMongoDBHandler
+
+@asynccontextmanager
+async def lifespan(app):
+    """Create the Redis and MongoDB clients in each worker process (after uvicorn forks) and close them on shutdown."""
+    setup_logging()
+    app.state.redis = aioredis.Redis(host="localhost", port=6379, socket_connect_timeout=0.5, socket_timeout=0.5)
+    app.state.mongo = AsyncMongoDBHandler(redis_client=app.state.redis)
+    try:
+        await app.state.mongo.ping()
+        await app.state.mongo.ensure_indexes()
+        await app.state.mongo.migrate_event_codes()
+    except ConnectionError as e:
+        raise Exception(f"Failed to initialize MongoDB: {e}")
+    yield
+    await app.state.mongo.close()
+    await app.state.redis.aclose()
 
 app = FastAPI(
     title="People Tracking API",
     description="API for retrieving people tracking statistics and configuring detection polygons.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
-
-class Point(BaseModel):
-    x: float = Field(..., ge=0, le=640, description="X-coordinate within canvas (0-640)")
-    y: float = Field(..., ge=0, le=480, description="Y-coordinate within canvas (0-480)")
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 class PolygonConfig(BaseModel):
     index: int = Field(..., ge=0, description="Unique polygon index")
-    points: List[Point] = Field(..., min_items=3, description="List of at least 3 points defining the polygon")
+    points: List[float] = Field(..., min_length=6, description="Flat list [x1, y1, x2, y2, ...] of at least 3 points defining the polygon")
+
+    @field_validator("points")
+    @classmethod
+    def check_points(cls, points):
+        """Require complete (x, y) pairs within canvas bounds (x: 0-640, y: 0-480)."""
+        if len(points) % 2 != 0:
+            raise ValueError("Polygon points must be (x, y) pairs")
+        if not all(0 <= x <= 640 and 0 <= y <= 480 for x, y in zip(points[::2], points[1::2])):
+            raise ValueError("Polygon points must lie within the canvas (x: 0-640, y: 0-480)")
+        return points
 
 class EventLog(BaseModel):
     person_id: int
@@ -27,56 +58,90 @@ class EventLog(BaseModel):
     event_type: str
     timestamp: str 
 
+class EventLogColumns(BaseModel):
+    person_id: List[int]
+    polygon_index: List[int]
+    event_type: List[str]
+    timestamp: List[str]
+
 class PolygonStats(BaseModel):
     polygon_index: int
     enter_count: int
     leave_count: int
 
 class StatsResponse(BaseModel):
-    logs: List[EventLog]
-    total: int
+    logs: Union[List[EventLog], EventLogColumns]
+    total: Optional[int] = None
     page: int
     limit: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_after: Optional[str] = None
     polygon_counts: List[PolygonStats]
 
 class LiveStatsResponse(BaseModel):
-    logs: List[EventLog]
+    logs: Union[List[EventLog], EventLogColumns]
     current_counts: dict
 
-def serialize_mongo_doc(doc):
-    """Convert MongoDB document to JSON-serializable format."""
-    if isinstance(doc, list):
-        return [serialize_mongo_doc(item) for item in doc]
-    if isinstance(doc, dict):
-        result = {}
-        for key, value in doc.items():
-            if isinstance(value, ObjectId):
-                result[key] = str(value)
-            elif isinstance(value, datetime):
-                result[key] = value.isoformat()
-            elif isinstance(value, (dict, list)):
-                result[key] = serialize_mongo_doc(value)
-            else:
-                result[key] = value
-        return result
-    return doc
-
-try:
-    mongo_handler = MongoDBHandler()
-except ConnectionError as e:
-    raise Exception(f"Failed to initialize MongoDB: {e}")
-
-@app.on_event("shutdown")
-def shutdown_event():
-    mongo_handler.close()
+def _default(obj):
+    """Serialize types orjson does not handle natively (MongoDB ObjectIds)."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError
+
+def dump_json(payload):
+    """Serialize a response payload containing MongoDB documents to JSON bytes."""
+    return orjson.dumps(
+        payload,
+        default=_default,
+        option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+def to_columns(logs):
+    """Pivot event log documents into one list per field (EventLogColumns layout)."""
+    return {field: [log[field] for log in logs] for field in EventLogColumns.model_fields}
+
+STATS_CACHE_TTL = 30
+LIVE_STATS_CACHE_TTL = 2
+LIVE_LOG_LIMIT = 100
+
+async def cache_get(redis_client, key):
+    """Return cached response bytes for a key, or None on a miss or if Redis is unavailable."""
+    try:
+        return await redis_client.get(key)
+    except RedisError:
+        return None
+
+async def cache_set(redis_client, key, body, ttl):
+    """Store response bytes under a key with a TTL, ignoring Redis failures."""
+    try:
+        await redis_client.set(key, body, ex=ttl)
+    except RedisError:
+        pass
+
+def json_response(request, body, cache_control="no-cache"):
+    """Wrap pre-serialized JSON bytes in a response with an ETag, or a 304 if the client's copy is current."""
+    etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def ndjson_lines(cursor):
+    """Yield one serialized JSON line per document as the cursor fetches batches."""
+    async for doc in cursor:
+        yield dump_json(doc) + b"\n"
 
 @app.get("/api/stats/", response_model=StatsResponse, summary="Get historical people tracking statistics")
 async def get_stats(
+    request: Request,
     start_time: Optional[datetime] = Query(None, description="Start time for filtering logs (ISO 8601, e.g., 2025-07-23T14:30:00Z)"),
     end_time: Optional[datetime] = Query(None, description="End time for filtering logs (ISO 8601, e.g., 2025-07-23T14:30:00Z)"),
     page: int = Query(1, ge=1, description="Page number for pagination"),
-    limit: int = Query(100, ge=1, le=1000, description="Number of logs per page")
+    limit: int = Query(100, ge=1, le=1000, description="Number of logs per page"),
+    after: Optional[str] = Query(None, description="Cursor from a previous response's next_after; returns the logs following it and ignores page"),
+    include_total: bool = Query(True, description="Count the logs in the time range; disable to skip the count"),
+    top_n: Optional[int] = Query(None, ge=1, description="Only return counts for the N polygons with the most enters"),
+    layout: Literal["records", "columns"] = Query("records", description="Return logs as a list of records or as one list per field")
 ):
     """
     Retrieve historical counts of people entering/leaving polygons, including per-polygon enter/leave counts.
@@ -85,86 +150,147 @@ async def get_stats(
     - **end_time**: Optional end time for filtering (UTC).
     - **page**: Page number for pagination (default: 1).
     - **limit**: Number of records per page (default: 100, max: 1000).
+    - **after**: Optional cursor (`next_after` of the previous page). Cursor pagination costs the same at any depth, while `page` gets slower the deeper it goes.
+    - **include_total**: Whether to return `total` and `total_pages` (default: true). Counts of a filtered range are cached for 30 seconds.
+    - **top_n**: Optional limit on `polygon_counts` to the polygons with the most enters, busiest first.
+    - **layout**: `records` (default) for a list of log objects, `columns` for one list per field.
     
     Returns a list of event logs, total count, pagination details, and enter/leave counts per polygon.
+    Responses are cached in Redis for 30 seconds per filter/page combination.
+    Responses carry an ETag (`If-None-Match` returns 304); ranges ending in the past are cacheable for 60 seconds.
+    
+    With `Accept: application/x-ndjson`, only the page of event logs is returned, streamed one JSON object per line.
     """
+    mongo_handler = request.app.state.mongo
+    redis_client = request.app.state.redis
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        try:
+            cursor = mongo_handler.iter_event_logs(start_time, end_time, page, limit, after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return StreamingResponse(ndjson_lines(cursor), media_type="application/x-ndjson")
+
+    # A range that ended in the past no longer changes, so clients and proxies may reuse it.
+    ended = end_time and (end_time if end_time.tzinfo else end_time.replace(tzinfo=timezone.utc)) < datetime.now(timezone.utc)
+    cache_control = "public, max-age=60" if ended else "no-cache"
+    cache_key = f"stats:{start_time}:{end_time}:{page}:{limit}:{after}:{include_total}:{top_n}:{layout}"
+    cached = await cache_get(redis_client, cache_key)
+    if cached is not None:
+        return json_response(request, cached, cache_control)
     try:
-        logs, total = mongo_handler.get_event_logs(start_time, end_time, page, limit)
-        total_pages = (total + limit - 1) // limit
-        polygon_counts = mongo_handler.get_polygon_stats(start_time, end_time)
-        serialized_logs = serialize_mongo_doc(logs)
-        
-        return JSONResponse(
-            content={
-                "logs": serialized_logs,
-                "total": total,
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-                "polygon_counts": polygon_counts
-            }
+        (logs, total, next_after), polygon_counts = await asyncio.gather(
+            mongo_handler.get_event_logs(start_time, end_time, page, limit, after, include_total),
+            mongo_handler.get_polygon_stats(start_time, end_time, top_n)
         )
+        total_pages = (total + limit - 1) // limit if total is not None else None
+        body = dump_json({
+            "logs": to_columns(logs) if layout == "columns" else logs,
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "total_pages": total_pages,
+            "next_after": next_after,
+            "polygon_counts": polygon_counts
+        })
+        await cache_set(redis_client, cache_key, body, STATS_CACHE_TTL)
+        return json_response(request, body, cache_control)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve stats: {e}")
 
 @app.get("/api/stats/live", response_model=LiveStatsResponse, summary="Get live people tracking statistics")
-async def get_live_stats():
+async def get_live_stats(
+    request: Request,
+    layout: Literal["records", "columns"] = Query("records", description="Return logs as a list of records or as one list per field")
+):
     """
     Retrieve the latest enter/leave events (last 10 seconds) and current counts of people in each polygon.
     
-    Returns recent event logs and a dictionary of current people counts per polygon.
+    - **layout**: `records` (default) for a list of log objects, `columns` for one list per field.
+    
+    Returns up to 100 recent event logs and a dictionary of current people counts per polygon.
+    Responses are cached in Redis for 2 seconds so concurrent dashboard polls share one query.
     """
+    mongo_handler = request.app.state.mongo
+    redis_client = request.app.state.redis
+    cache_key = f"stats:live:{layout}"
+    cached = await cache_get(redis_client, cache_key)
+    if cached is not None:
+        return json_response(request, cached)
     try:
-        logs = mongo_handler.get_live_events(seconds=10)
-        current_counts = {}
-        for log in logs:
-            polygon_index = log["polygon_index"]
-            event_type = log["event_type"]
-            if polygon_index not in current_counts:
-                current_counts[polygon_index] = 0
-            if event_type == "enter":
-                current_counts[polygon_index] += 1
-            elif event_type == "leave":
-                current_counts[polygon_index] -= 1
-            current_counts[polygon_index] = max(0, current_counts[polygon_index])
-            
-        serialized_logs = serialize_mongo_doc(logs)
-        
-        return JSONResponse(
-            content={
-                "logs": serialized_logs,
-                "current_counts": current_counts
-            }
+        logs, current_counts = await asyncio.gather(
+            mongo_handler.get_live_events(seconds=10, limit=LIVE_LOG_LIMIT),
+            mongo_handler.get_live_counts(seconds=10)
         )
+        body = dump_json({
+            "logs": to_columns(logs) if layout == "columns" else logs,
+            "current_counts": current_counts
+        })
+        await cache_set(redis_client, cache_key, body, LIVE_STATS_CACHE_TTL)
+        return json_response(request, body)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve live stats: {e}")
 
+async def sse_events(events):
+    """Format each event as a server-sent event carrying one JSON object."""
+    async for event in events:
+        yield b"data: " + dump_json(event) + b"\n\n"
+
+@app.get("/api/stats/live/stream", summary="Stream live people tracking events")
+async def stream_live_events(request: Request):
+    """
+    Stream enter/leave events as server-sent events (`text/event-stream`) as soon as they are logged.
+    
+    Each event is one `data:` line holding a JSON object with `person_id`, `polygon_index`, `event_type` and `timestamp`.
+    Uses a MongoDB change stream when the server is a replica set and polls once a second otherwise.
+    """
+    return StreamingResponse(
+        sse_events(request.app.state.mongo.subscribe_events()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 @app.post("/api/config/area", summary="Configure a polygon area")
-async def config_area(config: PolygonConfig):
+async def config_area(request: Request, config: PolygonConfig):
     """
     Configure a polygon area by specifying its index and coordinates.
     
     - **index**: Unique integer identifier for the polygon.
-    - **points**: List of at least 3 points (x, y) defining the polygon, within canvas bounds (x: 0-640, y: 0-480).
+    - **points**: Flat list `[x1, y1, x2, y2, ...]` of at least 3 points defining the polygon, within canvas bounds (x: 0-640, y: 0-480).
     
     Returns a success message if the polygon is saved.
     """
     try:
-        points = [coord for point in config.points for coord in [point.x, point.y]]
-        if len(points) < 6 or len(points) % 2 != 0:
-            raise ValueError("Polygon must have at least 3 points (6 coordinates)")
-        
-        if mongo_handler.save_polygon(config.index, points):
-            return {"message": f"Polygon-{config.index} configured successfully with {len(points)//2} vertices"}
+        if await request.app.state.mongo.save_polygon(config.index, config.points):
+            return {"message": f"Polygon-{config.index} configured successfully with {len(config.points)//2} vertices"}
         else:
             raise HTTPException(status_code=500, detail=f"Failed to save Polygon-{config.index}")
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to configure polygon: {e}")
 
+@app.post("/api/config/area/bulk", summary="Configure several polygon areas at once")
+async def config_areas_bulk(request: Request, configs: List[PolygonConfig] = Body(..., min_length=1)):
+    """
+    Configure several polygon areas in one request, saved with a single bulk write.
+    
+    - Body: a list of polygon configurations, each with the same **index** and **points** fields as `/api/config/area`.
+    
+    Returns a success message if all polygons are saved.
+    """
+    indices = [config.index for config in configs]
+    if len(set(indices)) != len(indices):
+        raise HTTPException(status_code=400, detail="Polygon indices must be unique")
+    try:
+        if await request.app.state.mongo.save_polygons([(config.index, config.points) for config in configs]):
+            return {"message": f"{len(configs)} polygons configured successfully"}
+        else:
+            raise HTTPException(status_code=500, detail=f"Failed to save polygons {indices}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to configure polygons: {e}")
+
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # "auto" picks uvloop and httptools when installed (not available on Windows) and falls back to asyncio/h11.
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=os.cpu_count(), loop="auto", http="auto", log_level="warning")
\ No newline at end of file
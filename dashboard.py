@@ -1,54 +1,91 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-import pytz
-import requests
+import httpx
 
 st.set_page_config(page_title="People Tracking Dashboard", layout="wide")
 
 API_BASE_URL = "http://localhost:8000"
-STATS_URL = f"{API_BASE_URL}/api/stats/"
-LIVE_STATS_URL = f"{API_BASE_URL}/api/stats/live"
+STATS_PATH = "/api/stats/"
+LIVE_STATS_PATH = "/api/stats/live"
+
+@st.cache_resource
+def get_client():
+    """Return an HTTP client shared across reruns so connections to the API are kept alive."""
+    return httpx.Client(base_url=API_BASE_URL, timeout=5, http2=True)
 
 if 'page' not in st.session_state:
     st.session_state.page = 1
 if 'limit' not in st.session_state:
     st.session_state.limit = 10
 
+@st.cache_data(ttl=2, show_spinner=False)
 def fetch_stats(start_time=None, end_time=None, page=1, limit=10):
     """Fetch historical stats from /api/stats/ with optional filters."""
-    params = {"page": page, "limit": limit}
+    params = {"page": page, "limit": limit, "layout": "columns"}
     if start_time:
         params["start_time"] = start_time.isoformat()
     if end_time:
         params["end_time"] = end_time.isoformat()
     
     try:
-        response = requests.get(STATS_URL, params=params, timeout=5)
+        response = get_client().get(STATS_PATH, params=params)
         response.raise_for_status()
         return response.json()
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         st.error(f"Failed to fetch stats: {e}")
-        return {"logs": [], "total": 0, "page": page, "limit": limit, "total_pages": 1, "polygon_counts": []}
+        return {"logs": {}, "total": 0, "page": page, "limit": limit, "total_pages": 1, "polygon_counts": []}
 
+@st.cache_data(ttl=2, show_spinner=False)
 def fetch_live_stats():
     """Fetch live stats from /api/stats/live."""
     try:
-        response = requests.get(LIVE_STATS_URL, timeout=5)
+        response = get_client().get(LIVE_STATS_PATH, params={"layout": "columns"})
         response.raise_for_status()
         return response.json()
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         st.error(f"Failed to fetch live stats: {e}")
-        return {"logs": [], "current_counts": {}}
+        return {"logs": {}, "current_counts": {}}
 
-st.title("People Tracking Dashboard")
+@st.cache_data(show_spinner=False)
+def parse_time(value):
+    """Parse a 'YYYY-MM-DD HH:MM:SS' UTC string, returning None if it is invalid."""
+    timestamp = pd.to_datetime(value, format="%Y-%m-%d %H:%M:%S", utc=True, errors="coerce")
+    return None if pd.isna(timestamp) else timestamp.to_pydatetime()
 
-col1, col2 = st.columns([2, 1])
+@st.fragment(run_every=5)
+def live_stats_panel():
+    """Render live stats; as a fragment it refreshes every 5 seconds without rerunning the whole page."""
+    live_stats = fetch_live_stats()
+    logs = live_stats.get("logs", {})
+    current_counts = live_stats.get("current_counts", {})
 
-# Column 1: Historical Stats
-with col1:
-    st.header("Historical Statistics")
+    if any(logs.values()):
+        try:
+            df = pd.DataFrame(logs)
+            if "timestamp" in df.columns:
+                df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601", utc=True, cache=True).dt.strftime("%Y-%m-%d %H:%M:%S UTC")
+                df.columns = ["Person ID", "Polygon Index", "Event Type", "Timestamp"]
+                st.subheader("Recent Events (Last 10 Seconds)")
+                st.dataframe(df, use_container_width=True)
+            else:
+                st.error("Timestamp field missing in live event logs.")
+        except Exception as e:
+            st.error(f"Failed to process live event logs: {e}")
 
+    # Display current counts
+    if current_counts:
+        counts_df = pd.DataFrame(
+            [(k, v) for k, v in current_counts.items()],
+            columns=["Polygon Index", "Current Count"]
+        )
+        st.subheader("Current People in Polygons")
+        st.dataframe(counts_df, use_container_width=True)
+    else:
+        st.write("No live data available.")
+
+@st.fragment
+def historical_stats_panel():
+    """Render historical stats; as a fragment, its filters and paging rerun only this panel."""
     st.subheader("Filter by Time Range (UTC)")
     time_col1, time_col2 = st.columns(2)
     with time_col1:
@@ -57,16 +94,12 @@ with col1:
         end_time_str = st.text_input("End Time (YYYY-MM-DD HH:MM:SS UTC)", "2025-07-23 23:59:59")
     
     # Parse time inputs
-    try:
-        start_time = datetime.strptime(start_time_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.UTC)
-    except ValueError:
-        start_time = None
+    start_time = parse_time(start_time_str)
+    if start_time is None:
         st.warning("Invalid start time format. Using no start time filter.")
     
-    try:
-        end_time = datetime.strptime(end_time_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.UTC)
-    except ValueError:
-        end_time = None
+    end_time = parse_time(end_time_str)
+    if end_time is None:
         st.warning("Invalid end time format. Using no end time filter.")
 
     st.subheader("Pagination")
@@ -81,19 +114,18 @@ with col1:
     st.session_state.limit = limit
 
     stats = fetch_stats(start_time, end_time, st.session_state.page, st.session_state.limit)
-    logs = stats.get("logs", [])
+    logs = stats.get("logs", {})
     total = stats.get("total", 0)
     page = stats.get("page", 1)
     total_pages = stats.get("total_pages", 1)
     polygon_counts = stats.get("polygon_counts", [])
  
     st.subheader("Event Logs")
-    if logs:
+    if any(logs.values()):
         try:
             df = pd.DataFrame(logs)
             if "timestamp" in df.columns:
-                df["timestamp"] = pd.to_datetime(df["timestamp"]).dt.strftime("%Y-%m-%d %H:%M:%S UTC")
-                df = df[["person_id", "polygon_index", "event_type", "timestamp"]]
+                df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601", utc=True, cache=True).dt.strftime("%Y-%m-%d %H:%M:%S UTC")
                 df.columns = ["Person ID", "Polygon Index", "Event Type", "Timestamp"]
                 st.dataframe(df, use_container_width=True)
                 st.write(f"Page {page} of {total_pages} | Total Records: {total}")
@@ -113,70 +145,16 @@ with col1:
     else:
         st.write("No polygon count data available.")
 
+st.title("People Tracking Dashboard")
+
+col1, col2 = st.columns([2, 1])
+
+# Column 1: Historical Stats
+with col1:
+    st.header("Historical Statistics")
+    historical_stats_panel()
+
 # Column 2: Live Stats
 with col2:
     st.header("Live Statistics")
-
-    live_stats_placeholder = st.empty()
-    with live_stats_placeholder.container():
-        live_stats = fetch_live_stats()
-        logs = live_stats.get("logs", [])
-        current_counts = live_stats.get("current_counts", {})
-
-        if logs:
-            try:
-                df = pd.DataFrame(logs)
-                if "timestamp" in df.columns:
-                    df["timestamp"] = pd.to_datetime(df["timestamp"]).dt.strftime("%Y-%m-%d %H:%M:%S UTC")
-                    df = df[["person_id", "polygon_index", "event_type", "timestamp"]]
-                    df.columns = ["Person ID", "Polygon Index", "Event Type", "Timestamp"]
-                    st.subheader("Recent Events (Last 10 Seconds)")
-                    st.dataframe(df, use_container_width=True)
-                else:
-                    st.error("Timestamp field missing in live event logs.")
-            except Exception as e:
-                st.error(f"Failed to process live event logs: {e}")
-        
-        # Display current counts
-        if current_counts:
-            counts_df = pd.DataFrame(
-                [(k, v) for k, v in current_counts.items()],
-                columns=["Polygon Index", "Current Count"]
-            )
-            st.subheader("Current People in Polygons")
-            st.dataframe(counts_df, use_container_width=True)
-        else:
-            st.write("No live data available.")
-
-st_autorefresh = st.session_state.get("st_autorefresh", 0)
-if st_autorefresh % 50 == 0:
-    live_stats_placeholder.empty()
-    with live_stats_placeholder.container():
-        live_stats = fetch_live_stats()
-        logs = live_stats.get("logs", [])
-        current_counts = live_stats.get("current_counts", {})
-        
-        if logs:
-            try:
-                df = pd.DataFrame(logs)
-                if "timestamp" in df.columns:
-                    df["timestamp"] = pd.to_datetime(df["timestamp"]).dt.strftime("%Y-%m-%d %H:%M:%S UTC")
-                    df = df[["person_id", "polygon_index", "event_type", "timestamp"]]
-                    df.columns = ["Person ID", "Polygon Index", "Event Type", "Timestamp"]
-                    st.subheader("Recent Events (Last 10 Seconds)")
-                    st.dataframe(df, use_container_width=True)
-                else:
-                    st.error("Timestamp field missing in live event logs.")
-            except Exception as e:
-                st.error(f"Failed to process live event logs: {e}")
-        
-        if current_counts:
-            counts_df = pd.DataFrame(
-                [(k, v) for k, v in current_counts.items()],
-                columns=["Polygon Index", "Current Count"]
-            )
-            st.subheader("Current People in Polygons")
-            st.dataframe(counts_df, use_container_width=True)
-        else:
-            st.write("No live data available.")
-st.session_state.st_autorefresh = st_autorefresh + 1
\ No newline at end of file
+    live_stats_panel()
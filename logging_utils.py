@@ -0,0 +1,24 @@
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+def setup_logging(level=logging.INFO):
+    """Route root logger records through an in-memory queue to stderr, written by a background listener thread.
+
+    Logging call sites only enqueue, so a burst of errors (e.g. while MongoDB is unreachable) never blocks
+    the tracking loop or the event loop on stdout/stderr I/O. The listener is stopped (draining the queue) at exit.
+    """
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,16 +1,75 @@
 import tkinter as tk
 from tkinter import messagebox
 import cv2
+import os
 from PIL import Image, ImageTk
 import threading
 import queue
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 import pytz
 from transformers import YolosImageProcessor, YolosForObjectDetection
 import torch
+import torch.nn.functional as F
 import numpy as np
+from numba import njit
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+from logging_utils import setup_logging
 from mongo_utils import MongoDBHandler
 
+# Keep PyTorch and OpenCV from each spawning a thread per core and starving the stream decoder and the Tk loop.
+torch.set_num_threads(min(4, os.cpu_count() or 1))
+torch.set_num_interop_threads(1)
+cv2.setNumThreads(2)
+
+# Tracked persons are stored column-wise in fixed-capacity arrays: attribute name -> (dtype, value of a free slot).
+# track_poly is the index of the polygon the person is in, or -1 when outside all polygons.
+TRACK_FIELDS = {
+    "track_x": (np.float64, 0.0),
+    "track_y": (np.float64, 0.0),
+    "track_poly": (np.int16, -1),
+    "track_missed": (np.int16, 0),
+    "track_ids": (np.int64, -1),
+    "track_alive": (np.bool_, False),
+}
+
+@njit(cache=True, fastmath=True)
+def points_in_polygon(vertices, centers):
+    """Ray-casting test of each (x, y) row of centers against a polygon given as a (V, 2) vertex array."""
+    n = vertices.shape[0]
+    inside = np.zeros(centers.shape[0], dtype=np.bool_)
+    for k in range(centers.shape[0]):
+        x, y = centers[k, 0], centers[k, 1]
+        j = n - 1
+        for i in range(n):
+            xi, yi = vertices[i, 0], vertices[i, 1]
+            xj, yj = vertices[j, 0], vertices[j, 1]
+            if ((yi > y) != (yj > y)) and (x < (xj - xi) * (y - yi) / (yj - yi + 1e-10) + xi):
+                inside[k] = not inside[k]
+            j = i
+    return inside
+
+@dataclass
+class Polygon:
+    polygon_id: int
+    points: np.ndarray
+    vertex_ids: list
+    bbox: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        """Store points as a contiguous (V, 2) float64 array and compute the bounding box."""
+        self.points = np.ascontiguousarray(self.points, dtype=np.float64).reshape(-1, 2)
+        self.update_bbox()
+
+    def update_bbox(self):
+        """Recompute the (x0, y0, x1, y1) bounding box after the points change."""
+        self.bbox = np.concatenate([self.points.min(axis=0), self.points.max(axis=0)])
+
+    def flat_points(self):
+        """Return the points as a flat [x1, y1, x2, y2, ...] list for the canvas and MongoDB."""
+        return self.points.ravel().tolist()
+
 class PolygonApp:
     def __init__(self, root):
         self.root = root
@@ -24,6 +83,10 @@ class PolygonApp:
             return
 
         self.frame_queue = queue.Queue()
+        # Display is fed straight from capture so the video keeps moving while detection works through a batch.
+        self.display_queue = queue.Queue(maxsize=1)
+        self.capture_queue = queue.Queue(maxsize=4)
+        self.preprocess_queue = queue.Queue(maxsize=2)
 
         self.main_frame = tk.Frame(root)
         self.main_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
@@ -48,13 +111,16 @@ class PolygonApp:
         self.temp_points = []  
         self.temp_polygon_id = None
         self.selected_vertex = None
+        self.drag_dirty_idx = None
         self.video_running = True
         self.current_photo = None
         self.video_image_id = None
-        self.person_tracker = {}  
+        self._grow_tracks(64)
         self.person_counter = 0 
         self.distance_threshold = 50 
         self.max_missed_frames = 30
+        self.batch_size = 8
+        self.detect_every = 2
         self.canvas_width = 640
         self.canvas_height = 480
 
@@ -76,13 +142,36 @@ class PolygonApp:
         self.canvas.bind("<Button-3>", self.on_right_click)
 
         self.hls_url = "https://cctvjss.jogjakota.go.id/margo-utomo/Selatan-Olive.stream/chunklist_w518845677.m3u8"
-        self.cap = cv2.VideoCapture(self.hls_url)
-
-        self.model = YolosForObjectDetection.from_pretrained('hustvl/yolos-tiny')
+        self.cap = self.open_capture()
+
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.dtype = torch.float16 if self.device == 'cuda' else torch.float32
+        self.model = YolosForObjectDetection.from_pretrained('hustvl/yolos-tiny').to(self.device, self.dtype).eval()
+        # Batches always have the same shape, so on CUDA the compiled model can replay fused kernels as CUDA graphs.
+        self.detector = torch.compile(self.model, mode='reduce-overhead') if self.device == 'cuda' else self.model
+        self.person_label_ids = torch.tensor(
+            [k for k, v in self.model.config.id2label.items() if v in ('person', 'human')], device=self.device)
         self.image_processor = YolosImageProcessor.from_pretrained("hustvl/yolos-tiny")
+        # Frames are always canvas-sized, so the processor's resize target is fixed; take it from one dummy run.
+        dummy = self.image_processor(images=Image.new('RGB', (self.canvas_width, self.canvas_height)), return_tensors="pt")
+        self.input_size = tuple(dummy["pixel_values"].shape[-2:])
+        self.pixel_mean = torch.tensor(self.image_processor.image_mean, device=self.device).view(1, 3, 1, 1)
+        self.pixel_std = torch.tensor(self.image_processor.image_std, device=self.device).view(1, 3, 1, 1)
+        self.copy_stream = torch.cuda.Stream() if self.device == 'cuda' else None
+        # One batch being filled, the queued batches and one being inferred; buffers return here once
+        # inferred or dropped, so a stale batch never frees a slot the model is still reading.
+        self.free_input_buffers = queue.Queue()
+        if self.copy_stream is not None:
+            for _ in range(self.preprocess_queue.maxsize + 2):
+                self.free_input_buffers.put(
+                    torch.empty((self.batch_size, 3, *self.input_size), dtype=self.dtype, device=self.device))
 
         self.root.after(1000, self.load_polygons_from_db)
 
+        self.capture_thread = threading.Thread(target=self.capture_frames, daemon=True)
+        self.capture_thread.start()
+        self.preprocess_thread = threading.Thread(target=self.preprocess_frames, daemon=True)
+        self.preprocess_thread.start()
         self.video_thread = threading.Thread(target=self.update_video, daemon=True)
         self.video_thread.start()
 
@@ -139,7 +228,7 @@ class PolygonApp:
                 x, y = points[i], points[i+1]
                 vertex_id = self.canvas.create_oval(x-5, y-5, x+5, y+5, fill='blue', tags='vertex')
                 vertex_ids.append(vertex_id)
-            self.polygons.append((polygon_id, points, vertex_ids))
+            self.polygons.append(Polygon(polygon_id, points, vertex_ids))
             self.log_action(f"Loaded Polygon-{poly['index']} from database with points {points}")
            
             self.canvas.tag_raise(polygon_id)
@@ -151,41 +240,46 @@ class PolygonApp:
             self.canvas.tag_lower(self.video_image_id)
         self.canvas.update()
 
-    def is_point_in_polygon(self, point, polygon_id, points):
-        """Check if a point is inside a polygon using ray-casting algorithm."""
-        x, y = point
-        n = len(points) // 2
-        inside = False
-        j = n - 1
-        for i in range(n):
-            xi, yi = points[2*i], points[2*i+1]
-            xj, yj = points[2*j], points[2*j+1]
-            if ((yi > y) != (yj > y)) and (x < (xj - xi) * (y - yi) / (yj - yi + 1e-10) + xi):
-                inside = not inside
-            j = i
+    def is_point_in_polygon(self, centers, polygon):
+        """Check which of an (N, 2) array of points are inside a polygon using the compiled ray-casting kernel."""
+        # Only points inside the bounding box need the full ray-casting test.
+        x0, y0, x1, y1 = polygon.bbox
+        in_box = (centers[:, 0] >= x0) & (centers[:, 0] <= x1) & (centers[:, 1] >= y0) & (centers[:, 1] <= y1)
+        if not in_box.any():
+            return in_box
+        inside = np.zeros(len(centers), dtype=bool)
+        inside[in_box] = points_in_polygon(polygon.points, np.ascontiguousarray(centers[in_box]))
         return inside
 
     def process_queue(self):
-        """Process items from the frame queue in the main thread."""
+        """Process log messages and the newest captured frame in the main thread, drawing at most once per tick."""
         try:
             while True:
                 item = self.frame_queue.get_nowait()
                 if isinstance(item, tuple) and item[0] == "log":
                     self.log_action(item[1])
-                else:
-                    frame, person_tracker = item
-                    self.latest_frame = frame
-                    self.person_tracker = person_tracker
-                    self.update_video_frame()
         except queue.Empty:
             pass
+        new_frame = None
+        try:
+            while True:
+                new_frame = self.display_queue.get_nowait()
+        except queue.Empty:
+            pass
+        if new_frame is not None:
+            self.latest_frame = new_frame
+            self.update_video_frame()
         if self.video_running:
             self.root.after(33, self.process_queue)
 
     def update_video_frame(self):
         """Update the canvas with the latest video frame."""
         if hasattr(self, 'latest_frame'):
-            self.current_photo = ImageTk.PhotoImage(self.latest_frame)
+            if self.current_photo is None:
+                self.current_photo = ImageTk.PhotoImage(self.latest_frame)
+            else:
+                # Paste into the existing image instead of allocating a new Tk photo per frame.
+                self.current_photo.paste(self.latest_frame)
             if self.video_image_id is None:
                 self.video_image_id = self.canvas.create_image(0, 0, image=self.current_photo, anchor='nw', tags='video')
             else:
@@ -193,90 +287,193 @@ class PolygonApp:
             self.canvas.image = self.current_photo
             # Ensure video is at the bottom and polygons/vertices are on top
             self.canvas.tag_lower('video')
-            for polygon_id, _, vertex_ids in self.polygons:
-                self.canvas.tag_raise(polygon_id)
-                for vertex_id in vertex_ids:
+            for polygon in self.polygons:
+                self.canvas.tag_raise(polygon.polygon_id)
+                for vertex_id in polygon.vertex_ids:
                     self.canvas.tag_raise(vertex_id)
 
-    def update_video(self):
-        """Process video frames and person tracking in a separate thread."""
+    def capture_frames(self):
+        """Read, resize and convert video frames, reconnecting to the stream when a read fails."""
         while self.video_running:
             ret, frame = self.cap.read()
             if ret:
-                frame = cv2.resize(frame, (640, 480))
+                if frame.shape[:2] != (self.canvas_height, self.canvas_width):
+                    frame = cv2.resize(frame, (self.canvas_width, self.canvas_height), interpolation=cv2.INTER_AREA)
                 frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                image = Image.fromarray(frame_rgb)
-
-                inputs = self.image_processor(images=image, return_tensors="pt")
-                outputs = self.model(**inputs)
-                target_sizes = torch.tensor([image.size[::-1]])
-                results = self.image_processor.post_process_object_detection(
-                    outputs, threshold=0.8, target_sizes=target_sizes)[0]
-
-                current_persons = []
-                for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-                    if score > 0.85 and self.model.config.id2label[label.item()] in ('person', 'human'):
-                        box = [round(i, 2) for i in box.tolist()]
-                        x1, y1, x2, y2 = map(int, box)
-                        center_x, center_y = (x1 + x2) / 2, (y1 + y2) / 2
-                        current_persons.append((center_x, center_y))
-
-                new_tracker = {}
-                used_previous_ids = set()
-                for current_center in current_persons:
-                    min_distance = float('inf')
-                    best_id = None
-                    for person_id, (prev_x, prev_y, polygon_index, missed_frames) in self.person_tracker.items():
-                        if person_id in used_previous_ids:
-                            continue
-                        distance = np.sqrt((current_center[0] - prev_x) ** 2 + (current_center[1] - prev_y) ** 2)
-                        if distance < min_distance and distance < self.distance_threshold:
-                            min_distance = distance
-                            best_id = person_id
-                    if best_id is not None:
-                        new_tracker[best_id] = (current_center[0], current_center[1],
-                                               self.person_tracker[best_id][2], 0)
-                        used_previous_ids.add(best_id)
-                    else:
-                        new_tracker[self.person_counter] = (current_center[0], current_center[1], None, 0)
-                        self.person_counter += 1
-
-                for person_id, (center_x, center_y, polygon_index, missed_frames) in list(self.person_tracker.items()):
-                    if person_id not in used_previous_ids:
-                        missed_frames += 1
-                        if missed_frames >= self.max_missed_frames and polygon_index is not None:
-                            self.frame_queue.put(("log", f"Person-{person_id} left Polygon-{polygon_index}"))
-                            self.mongo_handler.save_event_log(person_id, polygon_index, "leave")
-                            new_tracker[person_id] = (center_x, center_y, None, missed_frames)
-                        elif missed_frames < self.max_missed_frames:
-                            new_tracker[person_id] = (center_x, center_y, polygon_index, missed_frames)
-
-                for person_id, (center_x, center_y, prev_polygon_index, missed_frames) in new_tracker.items():
-                    if missed_frames >= self.max_missed_frames:
-                        continue
-                    inside_polygon_index = None
-                    for idx, (polygon_id, points, _) in enumerate(self.polygons):
-                        if self.is_point_in_polygon((center_x, center_y), polygon_id, points):
-                            inside_polygon_index = idx
-                            break
-                    if prev_polygon_index is None and inside_polygon_index is not None:
-                        self.frame_queue.put(("log", f"Person-{person_id} entered Polygon-{inside_polygon_index}"))
-                        self.mongo_handler.save_event_log(person_id, inside_polygon_index, "enter")
-                        new_tracker[person_id] = (center_x, center_y, inside_polygon_index, 0)
-                    elif prev_polygon_index is not None and inside_polygon_index is None and missed_frames == 0:
-                        self.frame_queue.put(("log", f"Person-{person_id} left Polygon-{prev_polygon_index}"))
-                        self.mongo_handler.save_event_log(person_id, prev_polygon_index, "leave")
-                        new_tracker[person_id] = (center_x, center_y, None, 0)
-                    elif prev_polygon_index != inside_polygon_index and inside_polygon_index is not None:
-                        self.frame_queue.put(("log", f"Person-{person_id} left Polygon-{prev_polygon_index}"))
-                        self.mongo_handler.save_event_log(person_id, prev_polygon_index, "leave")
-                        self.frame_queue.put(("log", f"Person-{person_id} entered Polygon-{inside_polygon_index}"))
-                        self.mongo_handler.save_event_log(person_id, inside_polygon_index, "enter")
-                        new_tracker[person_id] = (center_x, center_y, inside_polygon_index, 0)
-
-                self.frame_queue.put((image, new_tracker))
+                self.put_latest(self.capture_queue, (frame_rgb, datetime.now(timezone.utc)))
+                self.put_latest(self.display_queue, Image.fromarray(frame_rgb))
             else:
-                self.cap = cv2.VideoCapture(self.hls_url)
+                self.cap = self.open_capture()
+
+    def open_capture(self):
+        """Open the video stream with hardware decoding where available, keeping OpenCV's buffer to a single frame."""
+        cap = cv2.VideoCapture(self.hls_url, cv2.CAP_FFMPEG, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+        if not cap.isOpened():
+            cap = cv2.VideoCapture(self.hls_url)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def put_latest(self, q, item):
+        """Put an item on a bounded queue, dropping the oldest item when the consumer has fallen behind; returns the dropped item."""
+        dropped = None
+        while True:
+            try:
+                q.put_nowait(item)
+                return dropped
+            except queue.Full:
+                try:
+                    dropped = q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def preprocess_frames(self):
+        """Group captured frames into batches and start preprocessing every detect_every-th frame on the model device."""
+        batch = []
+        while self.video_running:
+            batch.append(self.capture_queue.get())
+            if len(batch) < self.batch_size * self.detect_every:
+                continue
+            frames = torch.from_numpy(np.stack([frame for frame, _ in batch[::self.detect_every]]))
+            dropped = self.put_latest(self.preprocess_queue, (batch, *self._preprocess(frames)))
+            if dropped is not None:
+                self._release_inputs(dropped[1])
+            batch = []
+
+    def _preprocess(self, frames):
+        """Turn an (N, H, W, 3) uint8 RGB batch into model inputs; on CUDA this runs on a side stream and an event marks its completion."""
+        if self.copy_stream is None:
+            return {"pixel_values": self._normalize(frames)}, None
+        with torch.cuda.stream(self.copy_stream):
+            pixel_values = self.free_input_buffers.get()
+            pixel_values.copy_(self._normalize(frames.pin_memory().to(self.device, non_blocking=True)))
+            ready = torch.cuda.Event()
+            ready.record(self.copy_stream)
+        return {"pixel_values": pixel_values}, ready
+
+    def _release_inputs(self, inputs):
+        """Hand a preprocessed batch's device buffer back for reuse once it has been inferred or dropped."""
+        if self.copy_stream is not None:
+            self.free_input_buffers.put(inputs["pixel_values"])
+
+    def _normalize(self, frames):
+        """Resize, rescale and normalize frames as YolosImageProcessor does, with tensor ops on the frames' device."""
+        pixels = frames.permute(0, 3, 1, 2).float()
+        pixels = F.interpolate(pixels, size=self.input_size, mode="bilinear", align_corners=False)
+        pixels.mul_(self.image_processor.rescale_factor).sub_(self.pixel_mean).div_(self.pixel_std)
+        return pixels.to(self.dtype)
+
+    def update_video(self):
+        """Run detection and tracking on preprocessed batches while the next batches are captured and displayed."""
+        while self.video_running:
+            batch, inputs, ready = self.preprocess_queue.get()
+            detections = self.detect_persons(inputs, ready, self.batch_size)
+            self._release_inputs(inputs)
+            for i, (_, timestamp) in enumerate(batch):
+                # Frames between detections reuse the latest detection; tracking still runs so polygon edits apply.
+                self.track_persons(detections[i // self.detect_every], timestamp)
+
+    def detect_persons(self, inputs, ready, batch_size):
+        """Run the detector once on a batch of frames and return the person center points found in each."""
+        target_sizes = torch.tensor([[self.canvas_height, self.canvas_width]] * batch_size, device=self.device)
+        results = self._infer(inputs, ready, target_sizes)
+
+        centers = []
+        for result in results:
+            mask = (result["scores"] > 0.85) & torch.isin(result["labels"], self.person_label_ids)
+            boxes = torch.round(result["boxes"][mask], decimals=2).trunc()
+            centers.append((boxes[:, :2] + boxes[:, 2:]) / 2)
+        # One device-to-host copy for the whole batch, split back into per-frame center lists.
+        counts = np.cumsum([len(c) for c in centers])[:-1]
+        return [c.tolist() for c in np.split(torch.cat(centers).float().cpu().numpy(), counts)]
+
+    @torch.inference_mode()
+    def _infer(self, inputs, ready, target_sizes):
+        """Run the model and post-processing without autograd tracking, once the input copy has finished."""
+        if ready is not None:
+            torch.cuda.current_stream().wait_event(ready)
+        with torch.autocast(self.device, dtype=torch.float16, enabled=self.device == 'cuda'):
+            outputs = self.detector(**inputs)
+        return self.image_processor.post_process_object_detection(
+            outputs, threshold=0.8, target_sizes=target_sizes)
+
+    def _grow_tracks(self, capacity):
+        """(Re)allocate the tracker arrays with room for capacity tracks, keeping the existing tracks."""
+        for name, (dtype, fill) in TRACK_FIELDS.items():
+            grown = np.full(capacity, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def _allocate_tracks(self, count):
+        """Return count free tracker slots, growing the arrays when they are full."""
+        free = np.flatnonzero(~self.track_alive)
+        if len(free) < count:
+            self._grow_tracks(max(2 * len(self.track_alive), len(self.track_alive) + count))
+            free = np.flatnonzero(~self.track_alive)
+        return free[:count]
+
+    def track_persons(self, current_persons, timestamp):
+        """Match detections to tracked persons and log polygon enter/leave events at the frame's timestamp."""
+        current = np.asarray(current_persons, dtype=np.float64).reshape(-1, 2)
+        alive = np.flatnonzero(self.track_alive)
+        matched_rows = matched_slots = np.empty(0, dtype=np.intp)
+        if len(current) and len(alive):
+            previous = np.column_stack([self.track_x[alive], self.track_y[alive]])
+            # Squared distances avoid the square root; the threshold is squared to match.
+            distances = cdist(current, previous, 'sqeuclidean')
+            threshold = self.distance_threshold ** 2
+            # Pairs beyond the threshold get a prohibitive cost so they are only assigned when unavoidable, then dropped.
+            rows, cols = linear_sum_assignment(np.where(distances < threshold, distances, 1e9))
+            keep = distances[rows, cols] < threshold
+            matched_rows, matched_slots = rows[keep], alive[cols[keep]]
+
+        self.track_x[matched_slots] = current[matched_rows, 0]
+        self.track_y[matched_slots] = current[matched_rows, 1]
+        self.track_missed[matched_slots] = 0
+
+        unmatched = np.setdiff1d(alive, matched_slots)
+        self.track_missed[unmatched] += 1
+        expired = unmatched[self.track_missed[unmatched] >= self.max_missed_frames]
+        for slot in expired[self.track_poly[expired] >= 0].tolist():
+            person_id, polygon_index = int(self.track_ids[slot]), int(self.track_poly[slot])
+            self.frame_queue.put(("log", f"Person-{person_id} left Polygon-{polygon_index}"))
+            self.mongo_handler.save_event_log(person_id, polygon_index, "leave", timestamp)
+        # Expired tracks outside any polygon are dropped; those that just left one are kept for one more frame.
+        self.track_alive[expired[self.track_poly[expired] < 0]] = False
+        self.track_poly[expired] = -1
+
+        new_rows = np.setdiff1d(np.arange(len(current)), matched_rows)
+        slots = self._allocate_tracks(len(new_rows))
+        self.track_x[slots] = current[new_rows, 0]
+        self.track_y[slots] = current[new_rows, 1]
+        self.track_poly[slots] = -1
+        self.track_missed[slots] = 0
+        self.track_ids[slots] = np.arange(self.person_counter, self.person_counter + len(slots))
+        self.track_alive[slots] = True
+        self.person_counter += len(slots)
+
+        active = np.flatnonzero(self.track_alive & (self.track_missed < self.max_missed_frames))
+        centers = np.column_stack([self.track_x[active], self.track_y[active]])
+        polygons = list(self.polygons)
+        inside = np.zeros((len(active), len(polygons)), dtype=bool)
+        for idx, polygon in enumerate(polygons):
+            inside[:, idx] = self.is_point_in_polygon(centers, polygon)
+        first_inside = np.where(inside.any(axis=1), inside.argmax(axis=1), -1) if polygons else np.full(len(active), -1)
+
+        # Only tracks whose polygon changed need logging: entering one, or leaving while still detected.
+        previous = self.track_poly[active]
+        changed = (first_inside != previous) & ((first_inside >= 0) | (self.track_missed[active] == 0))
+        for slot, prev_polygon_index, inside_polygon_index in zip(active[changed].tolist(), previous[changed].tolist(), first_inside[changed].tolist()):
+            person_id = int(self.track_ids[slot])
+            if prev_polygon_index >= 0:
+                self.frame_queue.put(("log", f"Person-{person_id} left Polygon-{prev_polygon_index}"))
+                self.mongo_handler.save_event_log(person_id, prev_polygon_index, "leave", timestamp)
+            if inside_polygon_index >= 0:
+                self.frame_queue.put(("log", f"Person-{person_id} entered Polygon-{inside_polygon_index}"))
+                self.mongo_handler.save_event_log(person_id, inside_polygon_index, "enter", timestamp)
+            self.track_poly[slot] = inside_polygon_index
+            self.track_missed[slot] = 0
 
     def start_polygon_creation(self):
         """Start creating a new polygon."""
@@ -309,7 +506,7 @@ class PolygonApp:
                 vertex_id = self.canvas.create_oval(x-5, y-5, x+5, y+5, fill='blue', tags='vertex')
                 vertex_ids.append(vertex_id)
             index = len(self.polygons)
-            self.polygons.append((polygon_id, self.temp_points[:], vertex_ids))
+            self.polygons.append(Polygon(polygon_id, self.temp_points, vertex_ids))
             if self.mongo_handler.save_polygon(index, self.temp_points[:]):
                 self.log_action(f"Added Polygon-{index} with {len(self.temp_points)//2} vertices")
             self.update_coordinates(polygon_id)
@@ -338,71 +535,61 @@ class PolygonApp:
 
         items = self.canvas.find_overlapping(event.x-5, event.y-5, event.x+5, event.y+5)
         for item in items:
-            for polygon_id, points, vertex_ids in self.polygons:
-                if item in vertex_ids:
-                    self.selected = polygon_id
-                    self.selected_vertex = vertex_ids.index(item)
+            for polygon in self.polygons:
+                if item in polygon.vertex_ids:
+                    self.selected = polygon.polygon_id
+                    self.selected_vertex = polygon.vertex_ids.index(item)
                     self.startxy = (event.x, event.y)
-                    self.canvas.itemconfig(polygon_id, width=4, outline='red')
-                    self.update_coordinates(polygon_id)
+                    self.canvas.itemconfig(polygon.polygon_id, width=4, outline='red')
+                    self.update_coordinates(polygon.polygon_id)
                     return
 
         items = self.canvas.find_overlapping(event.x-10, event.y-10, event.x+10, event.y+10)
         for item in items:
-            for polygon_id, _, _ in self.polygons:
-                if item == polygon_id:
-                    self.selected = polygon_id
+            for polygon in self.polygons:
+                if item == polygon.polygon_id:
+                    self.selected = polygon.polygon_id
                     self.selected_vertex = None
                     self.startxy = (event.x, event.y)
-                    self.canvas.itemconfig(polygon_id, width=4, outline='red')
-                    self.update_coordinates(polygon_id)
+                    self.canvas.itemconfig(polygon.polygon_id, width=4, outline='red')
+                    self.update_coordinates(polygon.polygon_id)
                     return
 
         self.selected = None
         self.selected_vertex = None
         self.coord_text.delete(1.0, tk.END)
         self.coord_text.insert(tk.END, "No polygon selected.\n")
-        for polygon_id, _, _ in self.polygons:
-            self.canvas.itemconfig(polygon_id, width=3, outline='blue')
+        for polygon in self.polygons:
+            self.canvas.itemconfig(polygon.polygon_id, width=3, outline='blue')
 
     def on_drag(self, event):
         """Handle dragging of polygons or vertices."""
         if not self.selected or not self.startxy:
             return
         dx, dy = event.x - self.startxy[0], event.y - self.startxy[1]
-        for idx, (polygon_id, points, vertex_ids) in enumerate(self.polygons):
-            if polygon_id == self.selected:
+        for idx, polygon in enumerate(self.polygons):
+            if polygon.polygon_id == self.selected:
                 if self.selected_vertex is not None:
                     # Update single vertex
-                    new_x = points[2*self.selected_vertex] + dx
-                    new_y = points[2*self.selected_vertex + 1] + dy
-                    # Clamp to canvas bounds
-                    new_x = max(0, min(self.canvas_width, new_x))
-                    new_y = max(0, min(self.canvas_height, new_y))
-                    points[2*self.selected_vertex] = new_x
-                    points[2*self.selected_vertex + 1] = new_y
-                    self.canvas.coords(polygon_id, points)
-                    vertex_id = vertex_ids[self.selected_vertex]
-                    self.canvas.coords(vertex_id, new_x-5, new_y-5, new_x+5, new_y+5)
+                    moved = polygon.points[self.selected_vertex:self.selected_vertex + 1]
+                    vertex_ids = polygon.vertex_ids[self.selected_vertex:self.selected_vertex + 1]
                 else:
                     # Move entire polygon
-                    for i in range(0, len(points), 2):
-                        new_x = points[i] + dx
-                        new_y = points[i+1] + dy
-                        # Clamp to canvas bounds
-                        new_x = max(0, min(self.canvas_width, new_x))
-                        new_y = max(0, min(self.canvas_height, new_y))
-                        points[i] = new_x
-                        points[i+1] = new_y
-                        vertex_id = vertex_ids[i//2]
-                        self.canvas.coords(vertex_id, new_x-5, new_y-5, new_x+5, new_y+5)
-                    self.canvas.coords(polygon_id, points)
-                # Save to MongoDB
-                self.mongo_handler.save_polygon(idx, points[:])
-                self.update_coordinates(polygon_id)
+                    moved = polygon.points
+                    vertex_ids = polygon.vertex_ids
+                moved += (dx, dy)
+                # Clamp to canvas bounds
+                np.clip(moved, 0, (self.canvas_width, self.canvas_height), out=moved)
+                polygon.update_bbox()
+                self.canvas.coords(polygon.polygon_id, polygon.flat_points())
+                for vertex_id, (new_x, new_y) in zip(vertex_ids, moved.tolist()):
+                    self.canvas.coords(vertex_id, new_x-5, new_y-5, new_x+5, new_y+5)
+                # Saved to MongoDB once the drag ends
+                self.drag_dirty_idx = idx
+                self.update_coordinates(polygon.polygon_id)
                 # Ensure polygon and vertices stay above video
-                self.canvas.tag_raise(polygon_id)
-                for vertex_id in vertex_ids:
+                self.canvas.tag_raise(polygon.polygon_id)
+                for vertex_id in polygon.vertex_ids:
                     self.canvas.tag_raise(vertex_id)
                 if self.video_image_id:
                     self.canvas.tag_lower(self.video_image_id)
@@ -415,6 +602,9 @@ class PolygonApp:
         if self.selected:
             self.canvas.itemconfig(self.selected, width=3, outline='blue')
             self.update_coordinates(self.selected)
+        if self.drag_dirty_idx is not None and self.drag_dirty_idx < len(self.polygons):
+            self.mongo_handler.queue_polygon(self.drag_dirty_idx, self.polygons[self.drag_dirty_idx].flat_points())
+        self.drag_dirty_idx = None
         self.selected = None
         self.selected_vertex = None
         self.startxy = None
@@ -426,18 +616,19 @@ class PolygonApp:
             return
         items = self.canvas.find_overlapping(event.x-10, event.y-10, event.x+10, event.y+10)
         for item in items:
-            for idx, (polygon_id, _, vertex_ids) in enumerate(self.polygons):
+            for idx, polygon in enumerate(self.polygons):
+                polygon_id, vertex_ids = polygon.polygon_id, polygon.vertex_ids
                 if item == polygon_id:
                     msg = messagebox.askyesnocancel('Info', 'Mark selected polygon as deleted?')
                     if msg:
                         self.canvas.delete(polygon_id)
                         for vertex_id in vertex_ids:
                             self.canvas.delete(vertex_id)
-                        self.polygons = [(p_id, p, v_ids) for p_id, p, v_ids in self.polygons if p_id != polygon_id]
+                        self.polygons = [p for p in self.polygons if p.polygon_id != polygon_id]
                         self.mongo_handler.delete_polygon(idx)
                         # Update indices of remaining polygons in the database
-                        for new_idx, (p_id, points, v_ids) in enumerate(self.polygons):
-                            self.mongo_handler.save_polygon(new_idx, points)
+                        for new_idx, p in enumerate(self.polygons):
+                            self.mongo_handler.save_polygon(new_idx, p.flat_points())
                         if self.selected == polygon_id:
                             self.selected = None
                         self.coord_text.delete(1.0, tk.END)
@@ -449,14 +640,14 @@ class PolygonApp:
 
     def update_coordinates(self, polygon_id=None):
         """Update the coordinate display for the selected polygon."""
-        if not polygon_id or polygon_id not in [p_id for p_id, _, _ in self.polygons]:
+        if not polygon_id or polygon_id not in [p.polygon_id for p in self.polygons]:
             return
         self.coord_text.delete(1.0, tk.END)
-        for idx, (p_id, points, _) in enumerate(self.polygons):
-            if p_id == polygon_id:
+        for idx, polygon in enumerate(self.polygons):
+            if polygon.polygon_id == polygon_id:
                 self.coord_text.insert(tk.END, f"Polygon-{idx} Points:\n")
-                for i in range(0, len(points), 2):
-                    self.coord_text.insert(tk.END, f"Point {i//2 + 1}: ({points[i]:.2f}, {points[i+1]:.2f})\n")
+                for i, (x, y) in enumerate(polygon.points.tolist()):
+                    self.coord_text.insert(tk.END, f"Point {i + 1}: ({x:.2f}, {y:.2f})\n")
                 break
 
     def clear_all(self):
@@ -471,7 +662,7 @@ class PolygonApp:
             if self.temp_polygon_id:
                 self.canvas.delete(self.temp_polygon_id)
                 self.temp_polygon_id = None
-            self.person_tracker.clear()
+            self.track_alive[:] = False
             self.mongo_handler.mark_all_polygons_deleted()
             self.coord_text.delete(1.0, tk.END)
             self.coord_text.insert(tk.END, "All polygons marked as deleted.\n")
@@ -490,6 +681,7 @@ class PolygonApp:
         self.root.destroy()
 
 if __name__ == "__main__":
+    setup_logging()
     root = tk.Tk()
     app = PolygonApp(root)
     root.mainloop()
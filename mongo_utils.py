@@ -1,24 +1,287 @@
-from pymongo import MongoClient
-from datetime import datetime, timedelta
-import pytz
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import AsyncMongoClient, InsertOne, MongoClient, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, OperationFailure
+import asyncio
+import atexit
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+import logging
+import os
+import queue
+import redis
+from redis.exceptions import RedisError
+import threading
+import time
 from typing import Optional
 
+UTC = timezone.utc
+logger = logging.getLogger(__name__)
+
+# Compound index backing every time-range query on event_logs; its timestamp prefix serves range scans and sorts,
+# and with code included the count aggregations are covered by the index without fetching documents.
+LOG_TIME_INDEX = [("timestamp", -1), ("polygon_index", 1), ("code", 1)]
+# Backs keyset pagination over event logs: newest first, ties on timestamp broken by _id.
+LOG_PAGE_INDEX = [("timestamp", -1), ("_id", -1)]
+LOG_INDEXES = [LOG_TIME_INDEX, LOG_PAGE_INDEX]
+# Indexes superseded by the ones above; dropped at startup so inserts stop maintaining them.
+LEGACY_LOG_INDEXES = [
+    [("timestamp", -1), ("polygon_index", 1)],
+    [("polygon_index", 1), ("code", 1), ("timestamp", -1)],
+]
+# Server error code for dropping an index that does not exist (already dropped, e.g. by another worker).
+INDEX_NOT_FOUND = 27
+# Optional single-field TTL index through which MongoDB expires logs older than LOG_RETENTION_DAYS (environment
+# variable, unset keeps logs forever). The API reconciles it at startup, after backfilling the Redis day counters
+# so expired days keep their stats.
+LOG_TTL_INDEX = [("timestamp", 1)]
+LOG_RETENTION_DAYS = int(os.environ["LOG_RETENTION_DAYS"]) if os.environ.get("LOG_RETENTION_DAYS") else None
+# Serves load_polygons' {"isDeleted": False} filter and its sort on index.
+POLYGON_INDEXES = [[("isDeleted", 1), ("index", 1)]]
+
+# Marker document recording one-off data migrations that have run on the log database.
+MIGRATIONS_COLLECTION = "migrations"
+MIGRATIONS_ID = "migrations"
+
+# Events are stored with an integer code instead of the "enter"/"leave" string; the API translates it back.
+EVENT_CODES = {"enter": 1, "leave": -1}
+EVENT_TYPES = {code: event_type for event_type, code in EVENT_CODES.items()}
+LOG_PROJECTION = {
+    "person_id": 1,
+    "polygon_index": 1,
+    "event_type": {"$cond": [{"$eq": ["$code", 1]}, "enter", "leave"]},
+    "timestamp": 1
+}
+# Live events are never paged by cursor, so they can drop _id as well.
+LIVE_LOG_PROJECTION = {**LOG_PROJECTION, "_id": 0}
+# Upper bound on documents per cursor batch when reading logs.
+LOG_BATCH_SIZE = 500
+
+# The API serves live events from an in-process buffer of the last LIVE_BUFFER_WINDOW, topped up with only the
+# events inserted since its last read. Events reach MongoDB well after their capture timestamp (detection batching,
+# inference and the writer's flush interval), so top-ups follow insertion order through the ObjectId the writer
+# assigns when it flushes. LIVE_TAIL_OVERLAP only has to cover the ObjectId's one second resolution, the bulk write
+# itself and clock skew between writer and API; top-ups re-read that far back and skip events already held.
+LIVE_BUFFER_SIZE = 10_000
+LIVE_BUFFER_WINDOW = timedelta(seconds=60)
+LIVE_TAIL_OVERLAP = timedelta(seconds=3)
+# Seconds between live buffer top-ups when event subscribers fall back to polling (no change streams).
+LIVE_POLL_INTERVAL = 1.0
+
+# Aggregation stages after $match that count enters and leaves per polygon.
+COUNT_STAGES = [
+    {"$project": {"polygon_index": 1, "code": 1, "_id": 0}},
+    {"$group": {
+        "_id": "$polygon_index",
+        "enter": {"$sum": {"$cond": [{"$eq": ["$code", EVENT_CODES["enter"]]}, 1, 0]}},
+        "leave": {"$sum": {"$cond": [{"$eq": ["$code", EVENT_CODES["leave"]]}, 1, 0]}}
+    }}
+]
+
+# Per-day event counters in Redis: hash "counts:YYYY-MM-DD" with "{polygon_index}:{event_type}" fields.
+# Days on or after the date stored under COUNTS_SINCE_KEY are incremented by MongoDBHandler as events are
+# logged; earlier days are backfilled from MongoDB once they are over and carry a "_complete" field.
+COUNTS_SINCE_KEY = "counts:since"
+ONE_DAY = timedelta(days=1)
+
+# Hourly event rollup in MongoDB: {polygon_index, hour, code, count} documents incremented by MongoDBHandler
+# as events are logged, from the hour stored in the HOURLY_SINCE_ID document on. Stats fall back to it when the
+# Redis day counters are unavailable; raw event logs are kept for audit.
+HOURLY_SINCE_ID = "since"
+HOURLY_INDEX = [("hour", 1), ("polygon_index", 1), ("code", 1)]
+ONE_HOUR = timedelta(hours=1)
+
+# Buffered writes are flushed once this many events are pending or this many seconds have passed.
+EVENT_BATCH_SIZE = 500
+EVENT_FLUSH_INTERVAL = 1.0
+# Event writes are acknowledged by the primary without waiting for the journal, so the writer does not block on
+# journal flushes but still sees failed inserts and skips counting them. An event acknowledged but not yet journaled
+# can be lost if the server crashes; polygon writes keep the default write concern.
+EVENT_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# Seconds a filtered event log count is reused before it is counted again.
+COUNT_CACHE_TTL = 30
+# Seconds the oldest event timestamp is reused. Logs only ever expire from the old end, so a stale value is
+# still a lower bound on the oldest event.
+OLDEST_CACHE_TTL = 60
+
+# Wire compression offered to the server, in order of preference; the server picks the first it supports.
+WIRE_COMPRESSION = {"compressors": "zstd,zlib", "zlibCompressionLevel": 3}
+
+# Synchronous clients shared by every MongoDBHandler in the process: (host, port) -> [client, handler count].
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _acquire_client(host, port):
+    """Return the shared MongoClient for host:port, creating it on first use."""
+    with _clients_lock:
+        entry = _clients.get((host, port))
+        if entry is None:
+            entry = _clients[(host, port)] = [MongoClient(f'mongodb://{host}:{port}/', serverSelectionTimeoutMS=5000, maxPoolSize=50, **WIRE_COMPRESSION), 0]
+        entry[1] += 1
+        return entry[0]
+
+def _release_client(host, port):
+    """Drop one handler's use of the shared MongoClient for host:port, closing it when no handler is left."""
+    with _clients_lock:
+        entry = _clients.get((host, port))
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _clients[(host, port)]
+            entry[0].close()
+
+def shutdown_all():
+    """Close every shared MongoClient regardless of how many handlers still use it."""
+    with _clients_lock:
+        for client, _ in _clients.values():
+            client.close()
+        _clients.clear()
+
+def _counts_key(day):
+    """Redis key of the counter hash for a UTC day."""
+    return f"counts:{day.isoformat()[:10]}"
+
+def _as_utc(dt):
+    """Treat naive datetimes (as returned by PyMongo) as UTC."""
+    return dt.replace(tzinfo=UTC) if dt.tzinfo is None else dt.astimezone(UTC)
+
+def _start_of_day(dt):
+    """Midnight (UTC) of the day containing dt."""
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _start_of_hour(dt):
+    """Start of the hour containing dt."""
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+def encode_cursor(log):
+    """Encode an event log's (timestamp, _id) position as an opaque pagination cursor."""
+    return f"{_as_utc(log['timestamp']).isoformat()}|{log['_id']}"
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor into a (timestamp, ObjectId) position, raising ValueError if it is malformed."""
+    try:
+        timestamp, object_id = cursor.split("|")
+        return _as_utc(datetime.fromisoformat(timestamp)), ObjectId(object_id)
+    except (ValueError, InvalidId):
+        raise ValueError("Invalid pagination cursor")
+
+def _index_specs(handler):
+    """(collection, keys, create_index options) of every index a handler's collections need."""
+    return (
+        [(handler.log_collection, keys, {}) for keys in LOG_INDEXES]
+        + [(handler.polygon_collection, keys, {}) for keys in POLYGON_INDEXES]
+        + [(handler.hourly_collection, HOURLY_INDEX, {"unique": True})]
+    )
+
+def _merge_bucket(counts, bucket):
+    """Add a "{polygon_index}:{event_type}" -> count mapping into {polygon_index: {event_type: count}}."""
+    for field, value in bucket.items():
+        if isinstance(field, bytes):
+            field = field.decode()
+        if field == "_complete":
+            continue
+        polygon_index, event_type = field.split(":")
+        totals = counts.setdefault(int(polygon_index), {})
+        totals[event_type] = totals.get(event_type, 0) + int(value)
+
 class MongoDBHandler:
-    def __init__(self, host='localhost', port=27017, polygon_db_name='cctv_tracking', log_db_name='people_tracking_logs', polygon_collection_name='polygons', log_collection_name='event_logs'):
-        """Initialize MongoDB connections for polygons and event logs."""
+    def __init__(self, host='localhost', port=27017, polygon_db_name='cctv_tracking', log_db_name='people_tracking_logs', polygon_collection_name='polygons', log_collection_name='event_logs', hourly_collection_name='hourly_stats', redis_host='localhost', redis_port=6379, watch_polygons=False):
+        """Initialize MongoDB connections for polygons and event logs, and the Redis event counters.
+
+        With watch_polygons, a change stream on the polygon collection invalidates the polygon cache when
+        another process edits polygons; change streams need a replica set.
+        """
+        self.client_key = (host, port)
+        self.client = _acquire_client(host, port)
         try:
-            self.client = MongoClient(f'mongodb://{host}:{port}/', serverSelectionTimeoutMS=5000)
             self.client.admin.command('ping')
             self.polygon_db = self.client[polygon_db_name]
             self.polygon_collection = self.polygon_db[polygon_collection_name]
             self.log_db = self.client[log_db_name]
-            self.log_collection = self.log_db[log_collection_name]
+            self.log_collection = self.log_db.get_collection(log_collection_name, write_concern=EVENT_WRITE_CONCERN)
+            self.hourly_collection = self.log_db.get_collection(hourly_collection_name, write_concern=EVENT_WRITE_CONCERN)
         except Exception as e:
+            _release_client(host, port)
             raise ConnectionError(f"Failed to connect to MongoDB: {e}")
+        self.redis = redis.Redis(host=redis_host, port=redis_port, socket_connect_timeout=0.5, socket_timeout=0.5)
+        self.counts_since = self._init_counts_since()
+        self.hourly_since = self._init_hourly_since()
+        self.closed = False
+        self._polygons_cache = []
+        self._polygons_dirty = True
+        self.write_queue = queue.Queue()
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+        atexit.register(self.flush)
+        self._ensure_indexes()
+        if watch_polygons:
+            threading.Thread(target=self._watch_polygons, daemon=True).start()
+
+    def _ensure_indexes(self):
+        """Create the event log, polygon and hourly rollup indexes and drop superseded ones, each independently.
+
+        The event log TTL index is left to the API, which backfills the day counters before enabling expiry.
+        """
+        for collection, keys, options in _index_specs(self):
+            try:
+                collection.create_index(keys, **options)
+            except Exception:
+                logger.exception("Failed to create index %s on %s", keys, collection.name)
+        for keys in LEGACY_LOG_INDEXES:
+            try:
+                self.log_collection.drop_index(keys)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    logger.exception("Failed to drop index %s", keys)
+
+    def _init_counts_since(self):
+        """Return the first day covered by the Redis counters, claiming tomorrow if unset; None disables counting."""
+        tomorrow = (datetime.now(UTC) + ONE_DAY).date()
+        try:
+            self.redis.set(COUNTS_SINCE_KEY, tomorrow.isoformat(), nx=True)
+            return date.fromisoformat(self.redis.get(COUNTS_SINCE_KEY).decode())
+        except RedisError as e:
+            logger.warning("Redis event counters disabled: %s", e)
+            return None
+
+    def _init_hourly_since(self):
+        """Return the first hour covered by the hourly rollup, claiming the next hour if unset; None disables it."""
+        next_hour = _start_of_hour(datetime.now(UTC)) + ONE_HOUR
+        try:
+            doc = self.hourly_collection.find_one_and_update(
+                {"_id": HOURLY_SINCE_ID},
+                {"$setOnInsert": {"since": next_hour}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return _as_utc(doc["since"])
+        except Exception:
+            logger.exception("Hourly event rollup disabled")
+            return None
 
     def load_polygons(self):
-        """Load non-deleted polygons from MongoDB, sorted by index."""
-        return list(self.polygon_collection.find({"isDeleted": False}).sort("index", 1))
+        """Load non-deleted polygons sorted by index, from MongoDB only if a write invalidated the cached list."""
+        if self._polygons_dirty:
+            # Cleared before reading so a write that lands during the read invalidates this result.
+            self._polygons_dirty = False
+            try:
+                self._polygons_cache = list(self.polygon_collection.find({"isDeleted": False}).sort("index", 1))
+            except Exception:
+                self._polygons_dirty = True
+                raise
+        return list(self._polygons_cache)
+
+    def _watch_polygons(self):
+        """Invalidate the polygon cache on every change to the polygon collection, from any process."""
+        try:
+            with self.polygon_collection.watch() as stream:
+                for _ in stream:
+                    self._polygons_dirty = True
+        except Exception as e:
+            if not self.closed:
+                logger.warning("Stopped watching polygons: %s", e)
 
     def save_polygon(self, index, points):
         """Save or update a polygon in MongoDB with isDeleted set to False."""
@@ -28,14 +291,20 @@ class MongoDBHandler:
                 {'$set': {
                     'points': points,
                     'isDeleted': False,
-                    'updated_at': datetime.now(pytz.UTC)
+                    'updated_at': datetime.now(UTC)
                 }},
                 upsert=True
             )
             return True
-        except Exception as e:
-            print(f"Failed to save polygon {index}: {e}")
+        except Exception:
+            logger.exception("Failed to save polygon %s", index)
             return False
+        finally:
+            self._polygons_dirty = True
+
+    def queue_polygon(self, index, points):
+        """Queue a polygon save for the background writer; queued saves of the same index keep only the latest."""
+        self.write_queue.put(("polygon", (index, points)))
 
     def delete_polygon(self, index):
         """Mark a polygon as deleted in MongoDB by setting isDeleted to True."""
@@ -44,41 +313,345 @@ class MongoDBHandler:
                 {'index': index},
                 {'$set': {
                     'isDeleted': True,
-                    'updated_at': datetime.now(pytz.UTC)
+                    'updated_at': datetime.now(UTC)
                 }}
             )
-        except Exception as e:
-            print(f"Failed to delete polygon {index}: {e}")
+        except Exception:
+            logger.exception("Failed to delete polygon %s", index)
+        self._polygons_dirty = True
 
     def mark_all_polygons_deleted(self):
-        """Mark all polygons as deleted in MongoDB by setting isDeleted to True."""
+        """Mark all polygons as deleted in MongoDB by setting isDeleted to True, touching only those not yet deleted."""
         try:
             self.polygon_collection.update_many(
-                {},
+                {"isDeleted": False},
                 {'$set': {
                     'isDeleted': True,
-                    'updated_at': datetime.now(pytz.UTC)
+                    'updated_at': datetime.now(UTC)
                 }}
             )
+        except Exception:
+            logger.exception("Failed to mark all polygons as deleted")
+        self._polygons_dirty = True
+
+    def purge_deleted_polygons(self):
+        """Permanently remove soft-deleted polygons to reclaim space, returning how many were removed.
+
+        Event logs keep their polygon_index, so only the deleted polygon's points are lost.
+        """
+        try:
+            return self.polygon_collection.delete_many({"isDeleted": True}).deleted_count
+        except Exception:
+            logger.exception("Failed to purge deleted polygons")
+            return 0
+
+    def save_event_log(self, person_id, polygon_index, event_type, timestamp=None):
+        """Buffer an enter/leave event for the event_logs collection, timestamped now unless given."""
+        event = {
+            'person_id': person_id,
+            'polygon_index': polygon_index,
+            'code': EVENT_CODES[event_type],
+            'timestamp': timestamp or datetime.now(UTC)
+        }
+        self.write_queue.put(("event", event))
+        return True
+
+    def flush(self, timeout=5):
+        """Block until every write queued so far has been sent to MongoDB."""
+        if not self.writer_thread.is_alive():
+            return
+        done = threading.Event()
+        self.write_queue.put(("flush", done))
+        done.wait(timeout)
+
+    def _write_loop(self):
+        """Collect queued writes in the background and save them in bulk every EVENT_BATCH_SIZE events or EVENT_FLUSH_INTERVAL seconds."""
+        events, polygons, waiters = [], {}, []
+        deadline = time.monotonic() + EVENT_FLUSH_INTERVAL
+        while True:
+            try:
+                kind, payload = self.write_queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                kind, payload = None, None
+            if kind == "event":
+                events.append(payload)
+            elif kind == "polygon":
+                polygons[payload[0]] = payload[1]
+            elif kind in ("flush", "stop"):
+                waiters.append(payload)
+            if waiters or len(events) >= EVENT_BATCH_SIZE or time.monotonic() >= deadline:
+                self._save_polygons(polygons)
+                self._save_events(events)
+                for done in waiters:
+                    if done is not None:
+                        done.set()
+                if kind == "stop":
+                    return
+                events, polygons, waiters = [], {}, []
+                deadline = time.monotonic() + EVENT_FLUSH_INTERVAL
+
+    def _save_polygons(self, polygons):
+        """Save an {index: points} mapping of polygons with a single bulk write."""
+        if not polygons:
+            return
+        now = datetime.now(UTC)
+        try:
+            self.polygon_collection.bulk_write([
+                UpdateOne(
+                    {'index': index},
+                    {'$set': {'points': points, 'isDeleted': False, 'updated_at': now}},
+                    upsert=True
+                )
+                for index, points in polygons.items()
+            ], ordered=False)
+        except Exception:
+            logger.exception("Failed to save polygons %s", list(polygons))
+        self._polygons_dirty = True
+
+    def _save_events(self, events):
+        """Write events with a single unordered bulk write, count them in Redis and roll them up by hour."""
+        if not events:
+            return
+        try:
+            self.log_collection.bulk_write([InsertOne(event) for event in events], ordered=False)
+        except BulkWriteError as e:
+            # An unordered bulk write inserts everything it can; count only the events that landed.
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            logger.exception("Failed to save %d of %d event logs", len(failed), len(events))
+            events = [event for i, event in enumerate(events) if i not in failed]
+        except Exception:
+            logger.exception("Failed to save %d event logs", len(events))
+            return
+        self._count_events(events)
+        self._roll_up_events(events)
+
+    def _count_events(self, events):
+        """Increment the Redis day counters for logged events."""
+        if self.counts_since is None:
+            return
+        try:
+            with self.redis.pipeline(transaction=False) as pipe:
+                for event in events:
+                    if event['timestamp'].date() >= self.counts_since:
+                        pipe.hincrby(_counts_key(event['timestamp']), f"{event['polygon_index']}:{EVENT_TYPES[event['code']]}", 1)
+                pipe.execute()
+        except RedisError:
+            logger.exception("Failed to count %d events", len(events))
+
+    def _roll_up_events(self, events):
+        """Increment the hourly rollup for logged events with one upsert per (polygon, hour, code)."""
+        if self.hourly_since is None:
+            return
+        hourly = {}
+        for event in events:
+            hour = _start_of_hour(event['timestamp'])
+            if _as_utc(hour) >= self.hourly_since:
+                key = (event['polygon_index'], hour, event['code'])
+                hourly[key] = hourly.get(key, 0) + 1
+        if not hourly:
+            return
+        try:
+            self.hourly_collection.bulk_write([
+                UpdateOne(
+                    {'polygon_index': polygon_index, 'hour': hour, 'code': code},
+                    {'$inc': {'count': count}},
+                    upsert=True
+                )
+                for (polygon_index, hour, code), count in hourly.items()
+            ], ordered=False)
+        except Exception:
+            logger.exception("Failed to roll up %d events", len(events))
+
+    def close(self):
+        """Write any queued saves, release the shared MongoDB client and close the Redis connection."""
+        self.write_queue.put(("stop", None))
+        self.writer_thread.join()
+        self.closed = True
+        _release_client(*self.client_key)
+        self.redis.close()
+
+class AsyncMongoDBHandler:
+    def __init__(self, host='localhost', port=27017, polygon_db_name='cctv_tracking', log_db_name='people_tracking_logs', polygon_collection_name='polygons', log_collection_name='event_logs', hourly_collection_name='hourly_stats', redis_client=None, log_retention_days=LOG_RETENTION_DAYS):
+        """Initialize asynchronous MongoDB connections used by the API; redis_client enables the day counters."""
+        self.client = AsyncMongoClient(f'mongodb://{host}:{port}/', serverSelectionTimeoutMS=5000, maxPoolSize=100, minPoolSize=10, **WIRE_COMPRESSION)
+        self.polygon_db = self.client[polygon_db_name]
+        self.polygon_collection = self.polygon_db[polygon_collection_name]
+        self.log_db = self.client[log_db_name]
+        self.log_collection = self.log_db[log_collection_name]
+        self.hourly_collection = self.log_db[hourly_collection_name]
+        self.redis = redis_client
+        self.log_retention_days = log_retention_days
+        self.count_cache = {}
+        self.oldest_cache = None
+        self.live_events = []
+        self.live_times = []
+        self.live_ids = set()
+        self.live_checked = None
+        self.live_lock = asyncio.Lock()
+
+    async def ping(self):
+        """Check that the MongoDB server is reachable."""
+        try:
+            await self.client.admin.command('ping')
         except Exception as e:
-            print(f"Failed to mark all polygons as deleted: {e}")
+            raise ConnectionError(f"Failed to connect to MongoDB: {e}")
 
-    def save_event_log(self, person_id, polygon_index, event_type):
-        """Save an enter/leave event to the event_logs collection."""
+    async def ensure_indexes(self):
+        """Create the event log, polygon and hourly rollup indexes used by the API queries, drop superseded ones and
+        reconcile the TTL index with log_retention_days, each independently so one failure does not skip the rest."""
+        for collection, keys, options in _index_specs(self):
+            try:
+                await collection.create_index(keys, **options)
+            except Exception:
+                logger.exception("Failed to create index %s on %s", keys, collection.name)
+        for keys in LEGACY_LOG_INDEXES:
+            try:
+                await self.log_collection.drop_index(keys)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    logger.exception("Failed to drop index %s", keys)
         try:
-            self.log_collection.insert_one({
-                'person_id': person_id,
-                'polygon_index': polygon_index,
-                'event_type': event_type,
-                'timestamp': datetime.now(pytz.UTC)
-            })
+            await self._reconcile_ttl_index()
+        except Exception:
+            logger.exception("Failed to update the event log TTL index")
+
+    async def _reconcile_ttl_index(self):
+        """Create, retune or drop the event log TTL index to match log_retention_days.
+
+        Before logs start expiring (or expire sooner), every whole day they cover is backfilled into the Redis day
+        counters; without Redis, expiry is not enabled.
+        """
+        existing = None
+        for name, info in (await self.log_collection.index_information()).items():
+            if [(field, int(direction)) for field, direction in info["key"]] == LOG_TTL_INDEX:
+                existing = (name, info.get("expireAfterSeconds"))
+        if self.log_retention_days is None:
+            if existing:
+                await self.log_collection.drop_index(existing[0])
+            return
+
+        seconds = self.log_retention_days * 86400
+        if existing and existing[1] == seconds:
+            return
+        if existing is None or existing[1] is None or seconds < existing[1]:
+            if self.redis is None:
+                logger.warning("Not enabling event log expiry: the Redis day counters are needed to keep expired days' stats")
+                return
+            await self._backfill_day_counts()
+        if existing:
+            await self.log_db.command("collMod", self.log_collection.name, index={"name": existing[0], "expireAfterSeconds": seconds})
+        else:
+            await self.log_collection.create_index(LOG_TTL_INDEX, expireAfterSeconds=seconds)
+
+    async def _backfill_day_counts(self):
+        """Fill the Redis day counters for every day with raw logs that the writer has not been counting."""
+        oldest = await self._oldest_event_time()
+        if oldest is not None:
+            await self._count_events_by_day(_start_of_day(_as_utc(oldest)), None)
+
+    async def migrate_event_codes(self):
+        """Convert event logs still storing an event_type string to the integer code, once per database.
+
+        The first worker to insert the marker document runs the scan; every later startup sees the marker and
+        skips it. A failed migration is logged and its marker removed so the next startup retries.
+        """
+        migrations = self.log_db[MIGRATIONS_COLLECTION]
+        try:
+            claim = await migrations.update_one(
+                {"_id": MIGRATIONS_ID}, {"$setOnInsert": {"event_codes": False}}, upsert=True
+            )
+            if claim.upserted_id is None:
+                return
+            await self.log_collection.update_many(
+                {"event_type": {"$exists": True}},
+                [
+                    {"$set": {"code": {"$cond": [{"$eq": ["$event_type", "enter"]}, 1, -1]}}},
+                    {"$unset": "event_type"}
+                ]
+            )
+            await migrations.update_one({"_id": MIGRATIONS_ID}, {"$set": {"event_codes": True}})
+        except Exception:
+            logger.exception("Failed to migrate event logs to integer codes")
+            try:
+                await migrations.delete_one({"_id": MIGRATIONS_ID, "event_codes": False})
+            except Exception:
+                pass
+
+    async def save_polygon(self, index, points):
+        """Save or update a polygon in MongoDB with isDeleted set to False."""
+        try:
+            await self.polygon_collection.update_one(
+                {'index': index},
+                {'$set': {
+                    'points': points,
+                    'isDeleted': False,
+                    'updated_at': datetime.now(UTC)
+                }},
+                upsert=True
+            )
             return True
-        except Exception as e:
-            print(f"Failed to save event log for Person-{person_id} {event_type} Polygon-{polygon_index}: {e}")
+        except Exception:
+            logger.exception("Failed to save polygon %s", index)
+            return False
+
+    async def save_polygons(self, polygons):
+        """Save or update several (index, points) polygons in a single bulk write."""
+        now = datetime.now(UTC)
+        try:
+            await self.polygon_collection.bulk_write([
+                UpdateOne(
+                    {'index': index},
+                    {'$set': {'points': points, 'isDeleted': False, 'updated_at': now}},
+                    upsert=True
+                )
+                for index, points in polygons
+            ], ordered=False)
+            return True
+        except Exception:
+            logger.exception("Failed to save polygons %s", [index for index, _ in polygons])
             return False
+
+    async def get_event_logs(self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, page: int = 1, limit: int = 100, after: Optional[str] = None, include_total: bool = False):
+        """Retrieve a page of event logs with optional time range, the total count if asked for, and the cursor of the next page.
+
+        With an after cursor the page starts right after that position and page is ignored; page-based
+        pagination has to skip over every earlier log, so it gets slower the deeper the page.
+        """
+        query = self._time_range(start_time, end_time)
+        if await self._is_empty_range(start_time, end_time):
+            return [], 0 if include_total else None, None
+        if include_total:
+            logs, total = await asyncio.gather(
+                self._page_cursor(query, page, limit, after).to_list(),
+                self._count_logs(query)
+            )
+        else:
+            logs, total = await self._page_cursor(query, page, limit, after).to_list(), None
+        next_after = encode_cursor(logs[-1]) if len(logs) == limit else None
         
-    def get_event_logs(self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, page: int = 1, limit: int = 100):
-        """Retrieve event logs with optional time range and pagination."""
+        return logs, total, next_after
+
+    def iter_event_logs(self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, page: int = 1, limit: int = 100, after: Optional[str] = None):
+        """Return an async cursor over one page of event logs, for streaming without materializing the page."""
+        return self._page_cursor(self._time_range(start_time, end_time), page, limit, after)
+
+    async def _count_logs(self, query):
+        """Count logs matching query: from collection metadata when unfiltered, otherwise cached for COUNT_CACHE_TTL seconds."""
+        if not query:
+            return await self.log_collection.estimated_document_count()
+        key = repr(query)
+        now = time.monotonic()
+        cached = self.count_cache.get(key)
+        if cached and now - cached[1] < COUNT_CACHE_TTL:
+            return cached[0]
+        total = await self.log_collection.count_documents(query)
+        self.count_cache = {k: v for k, v in self.count_cache.items() if now - v[1] < COUNT_CACHE_TTL}
+        self.count_cache[key] = (total, now)
+        return total
+
+    @staticmethod
+    def _time_range(start_time, end_time):
+        """Build the timestamp filter for an optional time range."""
         query = {}
         if start_time and end_time:
             if start_time >= end_time:
@@ -88,69 +661,346 @@ class MongoDBHandler:
             query["timestamp"] = {"$gte": start_time}
         elif end_time:
             query["timestamp"] = {"$lte": end_time}
-        
+        return query
+
+    def _page_cursor(self, query, page, limit, after):
+        """Return a find cursor over one page of logs, positioned by keyset cursor when given, else by page."""
         skip = (page - 1) * limit
-        logs = list(self.log_collection.find(query).sort("timestamp", -1).skip(skip).limit(limit))
-        total = self.log_collection.count_documents(query)
-        
-        return logs, total
+        if after:
+            timestamp, object_id = decode_cursor(after)
+            # The $lte bound lets the index scan start at the cursor; the $or breaks ties on that timestamp by _id.
+            bounds = dict(query.get("timestamp", {}))
+            bounds["$lte"] = min(_as_utc(bounds["$lte"]), timestamp) if "$lte" in bounds else timestamp
+            query = {**query, "timestamp": bounds, "$or": [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": object_id}}
+            ]}
+            skip = 0
+        return (
+            self.log_collection.find(query, LOG_PROJECTION)
+            .sort([("timestamp", -1), ("_id", -1)])
+            .skip(skip)
+            .limit(limit)
+            .batch_size(min(limit, LOG_BATCH_SIZE))
+            .hint(LOG_PAGE_INDEX)
+        )
 
-    def get_live_events(self, seconds: int = 10):
-        """Retrieve events from the last N seconds."""
-        threshold = datetime.now(pytz.UTC) - timedelta(seconds=seconds)
-        query = {"timestamp": {"$gte": threshold}}
-        logs = list(self.log_collection.find(query).sort("timestamp", -1))
-        return logs
+    async def get_live_events(self, seconds: int = 10, limit: int = 0):
+        """Retrieve events from the last N seconds, newest first, optionally capped at limit."""
+        now = datetime.now(UTC)
+        threshold = now - timedelta(seconds=seconds)
+        if timedelta(seconds=seconds) > LIVE_BUFFER_WINDOW:
+            query = {"timestamp": {"$gte": threshold}}
+            cursor = (
+                self.log_collection.find(query, LIVE_LOG_PROJECTION)
+                .sort("timestamp", -1)
+                .limit(limit)
+                .batch_size(min(limit, LOG_BATCH_SIZE) if limit else LOG_BATCH_SIZE)
+                .hint(LOG_TIME_INDEX)
+            )
+            return await cursor.to_list()
 
-    def get_polygon_stats(self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None):
-        """Retrieve enter/leave counts per polygon with optional time range."""
-        query = {}
-        if start_time and end_time:
-            if start_time >= end_time:
-                raise ValueError("start_time must be before end_time")
-            query["timestamp"] = {"$gte": start_time, "$lte": end_time}
-        elif start_time:
-            query["timestamp"] = {"$gte": start_time}
-        elif end_time:
-            query["timestamp"] = {"$lte": end_time}
-        
+        await self._top_up_live_events(now)
+        events = self.live_events[bisect_left(self.live_times, threshold):][::-1]
+        if limit:
+            events = events[:limit]
+        return [{key: value for key, value in event.items() if key != "_id"} for event in events]
+
+    async def subscribe_events(self):
+        """Yield events as they are logged, from a change stream, or by polling the live buffer where change streams
+        are unavailable (a standalone server rather than a replica set)."""
+        try:
+            async with await self.log_collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                async for change in stream:
+                    event = change["fullDocument"]
+                    yield {
+                        "person_id": event["person_id"],
+                        "polygon_index": event["polygon_index"],
+                        "event_type": EVENT_TYPES[event["code"]],
+                        "timestamp": _as_utc(event["timestamp"])
+                    }
+            return
+        except OperationFailure as e:
+            logger.info("Polling for live events, change streams unavailable: %s", e)
+
+        # Events already buffered when subscribing are not replayed; later ones are sent however late they land.
+        await self._top_up_live_events(datetime.now(UTC))
+        sent = set(self.live_ids)
+        while True:
+            await asyncio.sleep(LIVE_POLL_INTERVAL)
+            await self._top_up_live_events(datetime.now(UTC))
+            # Other requests top up the shared buffer in place while this generator is suspended at a yield.
+            for event in list(self.live_events):
+                if event["_id"] not in sent:
+                    sent.add(event["_id"])
+                    yield {key: value for key, value in event.items() if key != "_id"}
+            sent &= self.live_ids
+
+    async def _top_up_live_events(self, now):
+        """Add events logged since the last read to the live buffer and drop those older than LIVE_BUFFER_WINDOW."""
+        async with self.live_lock:
+            window_start = now - LIVE_BUFFER_WINDOW
+            if self.live_checked is None or self.live_checked - LIVE_TAIL_OVERLAP < window_start:
+                self.live_events, self.live_times, self.live_ids = [], [], set()
+                cursor = (
+                    self.log_collection.find({"timestamp": {"$gte": window_start}}, LOG_PROJECTION)
+                    .sort("timestamp", -1)
+                    .hint(LOG_TIME_INDEX)
+                )
+            else:
+                inserted_since = ObjectId.from_datetime(self.live_checked - LIVE_TAIL_OVERLAP)
+                cursor = self.log_collection.find({"_id": {"$gte": inserted_since}}, LOG_PROJECTION).sort("_id", -1)
+            # Read newest first so hitting the size cap keeps the latest events; the buffer is re-sorted below.
+            cursor = cursor.limit(LIVE_BUFFER_SIZE).batch_size(LOG_BATCH_SIZE)
+            new_events = []
+            async for event in cursor:
+                if event["_id"] not in self.live_ids:
+                    event["timestamp"] = _as_utc(event["timestamp"])
+                    new_events.append(event)
+            if new_events:
+                # Insertion order is not capture order, so keep the buffer sorted by timestamp for bisecting.
+                self.live_events.extend(new_events)
+                self.live_events.sort(key=lambda event: event["timestamp"])
+                self.live_ids.update(event["_id"] for event in new_events)
+            times = [event["timestamp"] for event in self.live_events]
+            start = max(bisect_left(times, window_start), len(times) - LIVE_BUFFER_SIZE)
+            for event in self.live_events[:start]:
+                self.live_ids.discard(event["_id"])
+            self.live_events, self.live_times = self.live_events[start:], times[start:]
+            self.live_checked = now
+
+    async def get_live_counts(self, seconds: int = 10):
+        """Compute the net enter/leave count per polygon over the last N seconds on the server."""
+        threshold = datetime.now(UTC) - timedelta(seconds=seconds)
         pipeline = [
-            {"$match": query},
+            {"$match": {"timestamp": {"$gte": threshold}}},
+            {"$project": {"polygon_index": 1, "code": 1, "_id": 0}},
             {"$group": {
-                "_id": {"polygon_index": "$polygon_index", "event_type": "$event_type"},
-                "count": {"$sum": 1}
-            }},
-            {"$group": {
-                "_id": "$_id.polygon_index",
-                "stats": {
-                    "$push": {
-                        "event_type": "$_id.event_type",
-                        "count": "$count"
-                    }
-                }
+                "_id": "$polygon_index",
+                "net": {"$sum": "$code"}
             }},
-            {"$sort": {"_id": 1}}
+            {"$project": {"net": {"$max": ["$net", 0]}}}
         ]
-        results = list(self.log_collection.aggregate(pipeline))
+        cursor = await self.log_collection.aggregate(pipeline, allowDiskUse=False, hint=LOG_TIME_INDEX)
+        return {doc["_id"]: doc["net"] async for doc in cursor}
+
+    async def get_polygon_stats(self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, top_n: Optional[int] = None):
+        """Retrieve enter/leave counts per polygon with optional time range, optionally only the top_n polygons by enters."""
+        query = self._time_range(start_time, end_time)
+        # Only a future range is known to be empty. A range ending before the oldest raw log can still cover
+        # expired days, which the counters keep and which _earliest_event_time includes in open-ended ranges.
+        if start_time and _as_utc(start_time) > datetime.now(UTC):
+            return []
+        counts = None
+        if self.redis is not None:
+            try:
+                counts = await self._count_events_by_day(start_time, end_time)
+            except RedisError as e:
+                logger.warning("Falling back to MongoDB for polygon stats: %s", e)
+        if counts is None:
+            counts = await self._count_events_by_hour(start_time, end_time)
+        if counts is None:
+            counts = {}
+            _merge_bucket(counts, await self._aggregate_counts(query))
         
-        stats = []
-        for result in results:
-            polygon_index = result["_id"]
-            enter_count = 0
-            leave_count = 0
-            for stat in result["stats"]:
-                if stat["event_type"] == "enter":
-                    enter_count = stat["count"]
-                elif stat["event_type"] == "leave":
-                    leave_count = stat["count"]
-            stats.append({
+        stats = [
+            {
                 "polygon_index": polygon_index,
-                "enter_count": enter_count,
-                "leave_count": leave_count
-            })
-        
+                "enter_count": totals.get("enter", 0),
+                "leave_count": totals.get("leave", 0)
+            }
+            for polygon_index, totals in sorted(counts.items())
+        ]
+        if top_n is not None:
+            stats = sorted(stats, key=lambda stat: stat["enter_count"], reverse=True)[:top_n]
         return stats
 
-    def close(self):
+    async def _count_events_by_day(self, start_time, end_time):
+        """Count events from Redis day counters for whole UTC days and from raw logs for the partial days at the edges.
+
+        Returns None when the range contains no whole day that the counters can serve.
+        """
+        now = datetime.now(UTC)
+        since = await self.redis.get(COUNTS_SINCE_KEY)
+        since = date.fromisoformat(since.decode()) if since else None
+        hourly_since = await self._hourly_since()
+        lower = start_time or await self._earliest_event_time(since, hourly_since)
+        if lower is None:
+            return {}
+        lower, upper = _as_utc(lower), _as_utc(end_time or now)
+
+        first_day = _start_of_day(lower)
+        if first_day < lower:
+            first_day += ONE_DAY
+        last_day = _start_of_day(upper)
+        today = _start_of_day(now)
+        if since is None or today.date() < since:
+            # Today's counter is only complete when it has been incremented since midnight.
+            last_day = min(last_day, today)
+        if first_day >= last_day:
+            return None
+
+        counts = {}
+        days = [first_day + i * ONE_DAY for i in range((last_day - first_day).days)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for day in days:
+                pipe.hgetall(_counts_key(day))
+            buckets = await pipe.execute()
+        missing = []
+        for day, bucket in zip(days, buckets):
+            if (since is not None and day.date() >= since) or b"_complete" in bucket:
+                _merge_bucket(counts, bucket)
+            else:
+                missing.append(day)
+        if missing:
+            daily = await self._aggregate_daily_counts(missing[0], missing[-1] + ONE_DAY)
+            if hourly_since is not None and missing[-1] >= hourly_since:
+                # Days the hourly rollup covers whole are complete there, even once their raw logs have expired.
+                rolled_up = await self._aggregate_daily_counts(max(missing[0], hourly_since), missing[-1] + ONE_DAY, rollup=True)
+                for day in missing:
+                    if day >= hourly_since:
+                        daily[day.date().isoformat()] = rolled_up.get(day.date().isoformat(), {})
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for day in missing:
+                    bucket = daily.get(day.date().isoformat(), {})
+                    pipe.delete(_counts_key(day))
+                    pipe.hset(_counts_key(day), mapping={**bucket, "_complete": 1})
+                    _merge_bucket(counts, bucket)
+                await pipe.execute()
+
+        head_query, tail_query = self._edge_queries(start_time, end_time, first_day, last_day)
+        for bucket in await asyncio.gather(self._aggregate_counts(head_query), self._aggregate_counts(tail_query)):
+            _merge_bucket(counts, bucket)
+        return counts
+
+    async def _count_events_by_hour(self, start_time, end_time):
+        """Count events from the hourly rollup for whole hours and from raw logs for the partial hours at the edges.
+
+        Returns None when the range contains no whole hour that the rollup covers.
+        """
+        hourly_since = await self._hourly_since()
+        if hourly_since is None:
+            return None
+        counts_since = None
+        if self.redis is not None:
+            try:
+                counts_since = await self.redis.get(COUNTS_SINCE_KEY)
+            except RedisError:
+                pass
+        counts_since = date.fromisoformat(counts_since.decode()) if counts_since else None
+        lower = start_time or await self._earliest_event_time(counts_since, hourly_since)
+        if lower is None:
+            return {}
+        lower, upper = _as_utc(lower), _as_utc(end_time or datetime.now(UTC))
+
+        first_hour = max(_start_of_hour(lower), hourly_since)
+        if first_hour < lower:
+            first_hour += ONE_HOUR
+        last_hour = _start_of_hour(upper)
+        if first_hour >= last_hour:
+            return None
+
+        counts = {}
+        head_query, tail_query = self._edge_queries(start_time, end_time, first_hour, last_hour)
+        for bucket in await asyncio.gather(
+            self._aggregate_hourly_counts(first_hour, last_hour),
+            self._aggregate_counts(head_query),
+            self._aggregate_counts(tail_query)
+        ):
+            _merge_bucket(counts, bucket)
+        return counts
+
+    @staticmethod
+    def _edge_queries(start_time, end_time, first, last):
+        """Build the raw log filters for the parts of the range before first and from last on."""
+        head_query = {"timestamp": {"$gte": start_time, "$lt": first} if start_time else {"$lt": first}}
+        tail_query = {"timestamp": {"$gte": last, "$lte": end_time} if end_time else {"$gte": last}}
+        return head_query, tail_query
+
+    async def _oldest_event_time(self):
+        """Timestamp of the oldest logged event, or None if there are none; cached for OLDEST_CACHE_TTL seconds."""
+        now = time.monotonic()
+        if self.oldest_cache and now - self.oldest_cache[1] < OLDEST_CACHE_TTL:
+            return self.oldest_cache[0]
+        doc = await self.log_collection.find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+        if doc is None:
+            return None
+        self.oldest_cache = (doc["timestamp"], now)
+        return doc["timestamp"]
+
+    async def _hourly_since(self):
+        """First hour the hourly rollup covers, or None if it has never been started."""
+        doc = await self.hourly_collection.find_one({"_id": HOURLY_SINCE_ID})
+        return _as_utc(doc["since"]) if doc else None
+
+    async def _earliest_event_time(self, counts_since, hourly_since):
+        """Lower bound of an open-ended stats range: the earliest of the oldest raw log and the first day or hour
+        the Redis counters and the hourly rollup count from, since those outlive expired logs. None if all are empty."""
+        candidates = [await self._oldest_event_time(), hourly_since]
+        if counts_since is not None:
+            candidates.append(datetime(counts_since.year, counts_since.month, counts_since.day, tzinfo=UTC))
+        candidates = [_as_utc(candidate) for candidate in candidates if candidate is not None]
+        return min(candidates) if candidates else None
+
+    async def _is_empty_range(self, start_time, end_time):
+        """Whether a time range ends before the oldest logged event or starts in the future, so no log can match."""
+        if start_time and _as_utc(start_time) > datetime.now(UTC):
+            return True
+        if end_time is None:
+            return False
+        oldest = await self._oldest_event_time()
+        return oldest is not None and _as_utc(end_time) < _as_utc(oldest)
+
+    async def _aggregate_counts(self, query):
+        """Aggregate raw event logs matching query into "{polygon_index}:{event_type}" -> count."""
+        cursor = await self.log_collection.aggregate([{"$match": query}, *COUNT_STAGES], allowDiskUse=False, hint=LOG_TIME_INDEX)
+        return {
+            f"{result['_id']}:{event_type}": result[event_type]
+            async for result in cursor
+            for event_type in EVENT_CODES
+        }
+
+    async def _aggregate_hourly_counts(self, start, end):
+        """Sum the hourly rollup for hours in [start, end) into "{polygon_index}:{event_type}" -> count."""
+        pipeline = [
+            {"$match": {"hour": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {"polygon_index": "$polygon_index", "code": "$code"},
+                "count": {"$sum": "$count"}
+            }}
+        ]
+        cursor = await self.hourly_collection.aggregate(pipeline, allowDiskUse=False, hint=HOURLY_INDEX)
+        return {
+            f"{result['_id']['polygon_index']}:{EVENT_TYPES[result['_id']['code']]}": result["count"]
+            async for result in cursor
+        }
+
+    async def _aggregate_daily_counts(self, start, end, rollup=False):
+        """Aggregate raw event logs, or the hourly rollup if rollup is set, in [start, end) into
+        {"YYYY-MM-DD": {"{polygon_index}:{event_type}": count}}."""
+        time_field = "hour" if rollup else "timestamp"
+        pipeline = [
+            {"$match": {time_field: {"$gte": start, "$lt": end}}},
+            {"$project": {time_field: 1, "polygon_index": 1, "code": 1, **({"count": 1} if rollup else {}), "_id": 0}},
+            {"$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${time_field}"}},
+                    "polygon_index": "$polygon_index",
+                    "code": "$code"
+                },
+                "count": {"$sum": "$count" if rollup else 1}
+            }}
+        ]
+        if rollup:
+            cursor = await self.hourly_collection.aggregate(pipeline, allowDiskUse=False, hint=HOURLY_INDEX)
+        else:
+            cursor = await self.log_collection.aggregate(pipeline, allowDiskUse=False, hint=LOG_TIME_INDEX)
+        daily = {}
+        async for result in cursor:
+            key = result["_id"]
+            daily.setdefault(key["day"], {})[f"{key['polygon_index']}:{EVENT_TYPES[key['code']]}"] = result["count"]
+        return daily
+
+    async def close(self):
         """Close the MongoDB connection."""
-        self.client.close()
\ No newline at end of file
+        await self.client.close()